@@ -0,0 +1,94 @@
+# Micro-benchmark of getting a rendered page onto the screen: the old path (pix.tobytes("ppm"),
+# a new PhotoImage and a new Label per frame) against the new one (PPM header over the raw samples,
+# loaded into one persistent PhotoImage shown by one canvas item).
+#
+#   python benchmarks/bench_display.py [file.pdf] [--zoom 2.0] [--frames 30]
+#
+# Without a display only the byte conversion is timed.
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fitz  # PyMuPDF: Renders the pixmaps that are displayed
+
+from pixmap_display import pixmap_to_ppm, update_photo
+from render_cache import render_page
+
+
+def sample_document():
+    document = fitz.open()
+    page = document.new_page()
+    for line in range(60):
+        page.insert_text((40, 40 + line * 12), f"Line {line} of a page used to time the display path. " * 2, fontsize=9)
+    return document
+
+
+def time_ms(function, frames):
+    times = []
+    for _ in range(frames):
+        start = time.perf_counter()
+        function()
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare the old and new pixmap display paths.")
+    parser.add_argument("pdf", nargs='?', help="PDF to render (default: a generated text page)")
+    parser.add_argument("--zoom", type=float, default=2.0)
+    parser.add_argument("--frames", type=int, default=30)
+    args = parser.parse_args(argv)
+
+    document = fitz.open(args.pdf) if args.pdf else sample_document()
+    pix = render_page(document, 0, args.zoom)
+    print(f"Page 1 at zoom {args.zoom}: {pix.width}x{pix.height} pixels")
+
+    results = {
+        "render (get_pixmap)": time_ms(lambda: render_page(document, 0, args.zoom), args.frames),
+        "old bytes: tobytes('ppm')": time_ms(lambda: pix.tobytes("ppm"), args.frames),
+        "new bytes: pixmap_to_ppm": time_ms(lambda: pixmap_to_ppm(pix), args.frames),
+    }
+
+    try:
+        import tkinter as tk
+        root = tk.Tk()
+    except Exception as e:
+        print(f"No display available ({e}), skipping the Tk part")
+        root = None
+
+    if root is not None:
+        canvas = tk.Canvas(root, width=pix.width, height=pix.height)
+        canvas.pack()
+        labels = []
+
+        def old_path():
+            img = tk.PhotoImage(data=pix.tobytes("ppm"))
+            canvas.delete("all")
+            for label in labels:
+                label.destroy()  # Not even done by the old viewer, which leaked the labels
+            labels[:] = [tk.Label(canvas, image=img)]
+            labels[0].image = img
+            canvas.create_window((0, 0), window=labels[0], anchor='nw')
+            root.update_idletasks()
+
+        photo = tk.PhotoImage()
+        canvas.create_image(0, 0, image=photo, anchor='nw')
+
+        def new_path():
+            update_photo(photo, pix)  # The image item keeps showing the same photo
+            root.update_idletasks()
+
+        results["old display path (per frame)"] = time_ms(old_path, args.frames)
+        results["new display path (per frame)"] = time_ms(new_path, args.frames)
+        root.destroy()
+
+    for name, ms in results.items():
+        print(f"{name:32} {ms:8.2f} ms (median of {args.frames})")
+
+
+if __name__ == "__main__":
+    main()
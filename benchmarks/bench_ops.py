@@ -0,0 +1,234 @@
+# Times the viewer's hot paths and the PDF operations without a GUI, on synthetic documents from
+# corpus.py, and writes p50/p95 latency, throughput and peak RSS per operation as JSON.
+# Every operation runs in a fresh process so its peak RSS is its own.
+#
+#   python benchmarks/bench_ops.py --pages 10 100 --output bench.json
+#   python benchmarks/bench_ops.py --pages 10 100 --compare bench.json   # show changes against an earlier run
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fitz  # PyMuPDF: Used by the operations being timed
+
+import corpus
+import pdf_engine
+from pixmap_display import pixmap_to_ppm
+from render_cache import render_page
+from search_index import SearchIndex
+from text_store import TextStore
+from tile_renderer import TILED_ZOOM, render_tile, visible_tiles
+
+VIEWPORT = (0, 0, 550, 610)  # The viewer's canvas
+ZOOMS = (1.0, 2.0, 4.0)
+
+
+def _timed(function, *args):
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+
+def bench_show_page(path, zoom, samples):
+    # Render and convert a page the way show_page does: whole pages, or the visible tiles at high zoom
+    document = fitz.open(path)
+    durations = []
+    for i in range(samples):
+        page_number = i % len(document)
+        start = time.perf_counter()
+        if zoom >= TILED_ZOOM:
+            tiles = visible_tiles(document.load_page(page_number).rect, zoom, 0, *VIEWPORT, margin=0)
+            for tile in tiles:
+                pixmap_to_ppm(render_tile(document, page_number, zoom, 0, *tile))
+        else:
+            pixmap_to_ppm(render_page(document, page_number, zoom))
+        durations.append(time.perf_counter() - start)
+    return durations, 1, "pages"
+
+
+def bench_search_index(path, samples):
+    document = fitz.open(path)
+    return [_timed(SearchIndex.build, document) for _ in range(min(samples, 3))], len(document), "pages"
+
+
+def bench_search_text(path, samples):
+    index = SearchIndex.build(fitz.open(path))
+    rng = random.Random(0)
+    queries = [" ".join(rng.choice(corpus.WORDS) for _ in range(rng.choice((1, 2)))) for _ in range(samples)]
+    return [_timed(index.search, query) for query in queries], 1, "queries"
+
+
+def bench_show_text_window(path, samples):
+    # Text of every page through a fresh TextStore, i.e. uncached extraction, in reading order like the
+    # single page window shows it
+    document = fitz.open(path)
+    store = TextStore(document)
+    pages = [i % len(document) for i in range(samples)]
+    return [_timed(store.get, page_number, True) for page_number in dict.fromkeys(pages)], 1, "pages"
+
+
+def _in_temp_dir(function):
+    def run(path, samples):
+        durations, units, unit = [], 0, ""
+        for _ in range(samples):
+            out_dir = tempfile.mkdtemp(prefix="pdfbench_")
+            try:
+                duration, units, unit = function(path, out_dir)
+                durations.append(duration)
+            finally:
+                shutil.rmtree(out_dir, ignore_errors=True)
+        return durations, units, unit
+    return run
+
+
+@_in_temp_dir
+def bench_merge(path, out_dir):
+    pages = len(fitz.open(path)) * 5
+    return _timed(pdf_engine.merge_pdfs, [path] * 5, os.path.join(out_dir, "merged.pdf")), pages, "pages"
+
+
+@_in_temp_dir
+def bench_merge_streaming(path, out_dir):
+    pages = len(fitz.open(path)) * 5
+    return _timed(pdf_engine.stream_merge_pdfs, [path] * 5, os.path.join(out_dir, "merged.pdf")), pages, "pages"
+
+
+@_in_temp_dir
+def bench_split(path, out_dir):
+    pages = len(fitz.open(path))
+    template = os.path.join(out_dir, "{stem}_{index:03d}.pdf")
+    return _timed(pdf_engine.split_document, path, "every 10", template, 1), pages, "pages"
+
+
+@_in_temp_dir
+def bench_encrypt_pdf(path, out_dir):
+    pages = len(fitz.open(path))
+    return _timed(pdf_engine.encrypt_pdf, path, os.path.join(out_dir, "encrypted.pdf"), "secret"), pages, "pages"
+
+
+OPERATIONS = {
+    "show_page": bench_show_page,
+    "search_index": bench_search_index,
+    "search_text": bench_search_text,
+    "show_text_window": bench_show_text_window,
+    "merge": bench_merge,
+    "merge_streaming": bench_merge_streaming,
+    "split": bench_split,
+    "encrypt_pdf": bench_encrypt_pdf,
+}
+
+
+def _peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None  # Not available on Windows
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)  # Bytes on macOS, KiB elsewhere
+
+
+def _run_operation(name, args):
+    durations, units, unit = OPERATIONS[name](*args)
+    return durations, units, unit, _peak_rss_mb()
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+def run_benchmark(name, path, kind, pages, samples, zoom=None):
+    args = (path, zoom, samples) if zoom is not None else (path, samples)
+    with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as executor:
+        durations, units, unit, peak_rss = executor.submit(_run_operation, name, args).result()
+
+    total = sum(durations)
+    result = {
+        "op": name,
+        "corpus": kind,
+        "pages": pages,
+        "samples": len(durations),
+        "p50_ms": round(statistics.median(durations) * 1000, 3),
+        "p95_ms": round(percentile(durations, 0.95) * 1000, 3),
+        "throughput": round(units * len(durations) / total, 1) if total else None,
+        "throughput_unit": f"{unit}/s",
+        "peak_rss_mb": peak_rss,
+    }
+    if zoom is not None:
+        result["zoom"] = zoom
+    return result
+
+
+def result_key(result):
+    return result["op"], result["corpus"], result["pages"], result.get("zoom")
+
+
+def compare(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = {result_key(result): result for result in json.load(f)["results"]}
+    print(f"\nChange in p50 against {baseline_path}:")
+    for result in results:
+        old = baseline.get(result_key(result))
+        if old and old["p50_ms"]:
+            change = (result["p50_ms"] - old["p50_ms"]) / old["p50_ms"] * 100
+            print(f"  {' '.join(str(part) for part in result_key(result) if part is not None):40} "
+                  f"{old['p50_ms']:10.2f} -> {result['p50_ms']:10.2f} ms ({change:+.1f}%)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark rendering and PDF operations on synthetic documents.")
+    parser.add_argument("--pages", type=int, nargs='+', default=[10, 100], help="Document sizes to generate")
+    parser.add_argument("--kinds", nargs='+', choices=corpus.KINDS, default=list(corpus.KINDS))
+    parser.add_argument("--ops", nargs='+', choices=list(OPERATIONS), default=list(OPERATIONS))
+    parser.add_argument("--zooms", type=float, nargs='+', default=list(ZOOMS), help="Zoom levels for show_page")
+    parser.add_argument("--samples", type=int, default=20, help="Timed repetitions per operation")
+    parser.add_argument("--corpus-dir", default=os.path.join(tempfile.gettempdir(), "pdfviewer_bench_corpus"))
+    parser.add_argument("--output", help="Write the results to this JSON file (default: stdout)")
+    parser.add_argument("--compare", help="Earlier JSON results to compare the p50 latencies with")
+    args = parser.parse_args(argv)
+
+    results = []
+    for kind in args.kinds:
+        for pages in args.pages:
+            path = corpus.generate(args.corpus_dir, kind, pages)
+            for name in args.ops:
+                # The heavier operations get fewer samples, one run of them already covers every page
+                samples = args.samples if name in ("show_page", "search_text", "show_text_window") else max(1, args.samples // 5)
+                for zoom in (args.zooms if name == "show_page" else [None]):
+                    result = run_benchmark(name, path, kind, pages, samples, zoom)
+                    results.append(result)
+                    print(f"{name:18} {kind:10} {pages:6} pages {'' if zoom is None else f'zoom {zoom:<4}'} "
+                          f"p50 {result['p50_ms']:9.2f} ms  p95 {result['p95_ms']:9.2f} ms", file=sys.stderr)
+
+    report = {
+        "meta": {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "pymupdf": fitz.VersionBind,
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+# Synthetic PDFs for the benchmarks, generated locally with PyMuPDF so no test documents are needed.
+#
+#   python benchmarks/corpus.py out_dir --pages 10 100 1000
+import argparse
+import os
+import random
+
+import fitz  # PyMuPDF: Used to generate the documents
+
+WORDS = ("lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor incididunt ut labore "
+         "et dolore magna aliqua contract clause party agreement termination liability manual chapter").split()
+KINDS = ("text", "images", "many_pages")
+
+
+def _paragraph(rng, words):
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+def text_heavy(pages, rng):
+    # Dense pages of small text with a top-level outline entry every 10 pages
+    document = fitz.open()
+    for number in range(pages):
+        page = document.new_page()
+        text = "\n\n".join(_paragraph(rng, 90) for _ in range(8))
+        page.insert_textbox(fitz.Rect(36, 36, page.rect.width - 36, page.rect.height - 36), text, fontsize=9)
+    document.set_toc([[1, f"Chapter {i // 10 + 1}", i + 1] for i in range(0, pages, 10)])
+    return document
+
+
+def image_heavy(pages, rng):
+    # Every page shows a few noisy photo-like images, half of them shared between pages
+    shared = [_noise_image(rng, 400, 300) for _ in range(3)]
+    document = fitz.open()
+    for number in range(pages):
+        page = document.new_page()
+        page.insert_text((36, 40), f"Scanned page {number + 1}", fontsize=14)
+        page.insert_image(fitz.Rect(36, 60, 556, 450), stream=shared[number % len(shared)])
+        page.insert_image(fitz.Rect(36, 460, 556, 800), stream=_noise_image(rng, 300, 200))
+    return document
+
+
+def many_pages(pages, rng):
+    # Small pages with one line of text each, the page count is what matters
+    document = fitz.open()
+    for number in range(pages):
+        page = document.new_page(width=420, height=595)
+        page.insert_text((36, 60), f"Page {number + 1}: {_paragraph(rng, 8)}", fontsize=11)
+    return document
+
+
+def _noise_image(rng, width, height):
+    # Random pixels, which JPEG cannot compress much, like a scan
+    pix = fitz.Pixmap(fitz.csRGB, width, height, rng.randbytes(width * height * 3), 0)
+    return pix.tobytes("jpeg")
+
+
+GENERATORS = {"text": text_heavy, "images": image_heavy, "many_pages": many_pages}
+
+
+def generate(out_dir, kind, pages, seed=0):
+    # Writes (or reuses) out_dir/<kind>_<pages>.pdf and returns its path
+    path = os.path.join(out_dir, f"{kind}_{pages}.pdf")
+    if not os.path.exists(path):
+        os.makedirs(out_dir, exist_ok=True)
+        document = GENERATORS[kind](pages, random.Random(seed))
+        document.save(path + ".tmp", garbage=3, deflate=True)
+        os.replace(path + ".tmp", path)
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate synthetic PDFs for the benchmarks.")
+    parser.add_argument("out_dir")
+    parser.add_argument("--pages", type=int, nargs='+', default=[10, 100])
+    parser.add_argument("--kinds", nargs='+', choices=KINDS, default=list(KINDS))
+    args = parser.parse_args(argv)
+    for kind in args.kinds:
+        for pages in args.pages:
+            print(generate(args.out_dir, kind, pages))
+
+
+if __name__ == "__main__":
+    main()
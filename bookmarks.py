@@ -0,0 +1,241 @@
+import bisect
+import tkinter as tk
+from tkinter import ttk, simpledialog, messagebox
+
+
+def fold(text):
+    return " ".join(text.casefold().split())  # Case and runs of whitespace do not matter when looking up titles
+
+
+def fuzzy_score(query, title):
+    # The characters of the query have to appear in the title in order ("intro" in "Introduction",
+    # "ch12" in "Chapter 12"). Returns None if they don't, otherwise a score where lower is better:
+    # the letters skipped in between, then how late the match starts.
+    start = position = title.find(query[0])
+    if start < 0:
+        return None
+    for char in query[1:]:
+        position = title.find(char, position + 1)
+        if position < 0:
+            return None
+    return position + 1 - start - len(query), start
+
+
+# The document outline (the PDF's own bookmarks), read from get_toc() the first time it is needed.
+# Entries are [level, title, page, destination] as get_toc(simple=False) gives them, page starting at 1
+# and -1 for entries that do not point into the document. Changes are written back with set_toc().
+class Outline:
+    def __init__(self, document):
+        self.document = document
+        self._entries = None
+        self._index = None  # Sorted (folded title from one of its words on, position), for prefix lookups
+        self._folded = None  # Folded title of every entry, for fuzzy lookups
+
+    @property
+    def entries(self):
+        if self._entries is None:
+            self._entries = [list(item) for item in self.document.get_toc(simple=False)]
+        return self._entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def page_of(self, position):
+        page = self.entries[position][2]
+        return page - 1 if page > 0 else None  # Zero-based like the viewer's page numbers
+
+    def add(self, title, page_number):
+        # New bookmarks go on the top level, after every top-level entry for the same or an earlier
+        # page (and its children), so the outline stays in page order
+        position = len(self.entries)
+        for i, (level, _, page, *_) in enumerate(self.entries):
+            if level == 1 and page > page_number + 1:
+                position = i
+                break
+        self.entries.insert(position, [1, title, page_number + 1])
+        self._index = None
+        return position
+
+    def rename(self, position, title):
+        self.entries[position][1] = title
+        self._index = None
+
+    def remove(self, position):
+        # The children of the removed entry move up one level and stay in the outline
+        level = self.entries.pop(position)[0]
+        while position < len(self.entries) and self.entries[position][0] > level:
+            self.entries[position][0] -= 1
+            position += 1
+        self._index = None
+
+    def parents(self):
+        # position -> position of its parent (None on the top level), in outline order
+        parents = {}
+        stack = []  # Positions of the open ancestors, one per level
+        for position, (level, *_) in enumerate(self.entries):
+            del stack[level - 1:]
+            parents[position] = stack[-1] if stack else None
+            stack.append(position)
+        return parents
+
+    def _sorted_titles(self):
+        if self._index is None:
+            self._folded = [fold(title) for _, title, *_ in self.entries]
+            index = []
+            for position, title in enumerate(self._folded):
+                words = title.split(" ")
+                index.extend((" ".join(words[i:]), position) for i in range(len(words)))
+            index.sort()
+            self._index = index
+        return self._index
+
+    def search(self, query, limit=200):
+        # Positions of the entries matching the query: titles with a word starting with it first
+        # (found by bisecting the sorted titles), then fuzzy matches, best first
+        query = fold(query)
+        if not query:
+            return list(range(min(limit, len(self.entries))))
+
+        index = self._sorted_titles()
+        matches = []
+        for i in range(bisect.bisect_left(index, (query,)), len(index)):
+            title, position = index[i]
+            if not title.startswith(query):
+                break
+            matches.append(position)
+        matches = sorted(set(matches))[:limit]
+
+        if len(matches) < limit:
+            found = set(matches)
+            scored = []
+            for position, title in enumerate(self._folded):
+                if position not in found:
+                    score = fuzzy_score(query, title)
+                    if score is not None:
+                        scored.append((score, position))
+            scored.sort()
+            matches.extend(position for _, position in scored[:limit - len(matches)])
+        return matches
+
+
+# Window with the outline as a tree and a search box above it. Typing filters the outline down to
+# the matching entries, selecting an entry (also with the arrow keys) shows its page right away.
+# Children are only added to the tree when their parent is opened, so long outlines open instantly.
+class BookmarkPanel:
+    def __init__(self, master, outline, on_select, on_add, on_change):
+        self.outline = outline
+        self.on_select = on_select  # Called with the zero-based page of the selected bookmark
+        self.on_add = on_add  # Called to bookmark the page being viewed
+        self.on_change = on_change  # Called after a bookmark was renamed or removed
+        self.children = {}  # Position of an entry (None for the top level) -> positions of its children
+        self.filter_job = None
+
+        self.window = tk.Toplevel(master)
+        self.window.title("Bookmarks")
+        self.window.geometry("360x520")
+
+        self.query = tk.StringVar()
+        entry = ttk.Entry(self.window, textvariable=self.query)
+        entry.pack(side=tk.TOP, fill=tk.X, padx=4, pady=4)
+        entry.bind("<Down>", lambda event: self.focus_first())
+        entry.bind("<Return>", lambda event: self.focus_first())
+        self.query.trace_add("write", lambda *args: self.schedule_filter())
+
+        buttons = ttk.Frame(self.window)
+        buttons.pack(side=tk.BOTTOM, fill=tk.X, padx=4, pady=4)
+        ttk.Button(buttons, text="Add", command=self.on_add).pack(side=tk.LEFT)
+        ttk.Button(buttons, text="Rename", command=self.rename_selected).pack(side=tk.LEFT)
+        ttk.Button(buttons, text="Remove", command=self.remove_selected).pack(side=tk.LEFT)
+
+        self.tree = ttk.Treeview(self.window, columns=("page",), selectmode="browse")
+        self.tree.heading("#0", text="Title")
+        self.tree.heading("page", text="Page")
+        self.tree.column("page", width=60, anchor=tk.E, stretch=False)
+        scrollbar = tk.Scrollbar(self.window, command=self.tree.yview)
+        self.tree.config(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+
+        self.tree.bind("<<TreeviewOpen>>", self.on_open)
+        self.tree.bind("<<TreeviewSelect>>", self.on_tree_select)
+        self.tree.bind("<Delete>", lambda event: self.remove_selected())
+        self.tree.bind("<F2>", lambda event: self.rename_selected())
+
+        entry.focus_set()
+        self.reload()
+
+    def exists(self):
+        return self.window.winfo_exists()
+
+    def set_outline(self, outline):
+        self.outline = outline
+        self.query.set("")
+        self.reload()
+
+    def reload(self):
+        self.children = {}
+        for position, parent in self.outline.parents().items():
+            self.children.setdefault(parent, []).append(position)
+        self.filter()
+
+    def insert_entries(self, parent, positions, prefix=""):
+        for position in positions:
+            _, title, page, *_ = self.outline.entries[position]
+            item = self.tree.insert(parent, tk.END, iid=f"{prefix}{position}", text=title,
+                                    values=(page if page > 0 else "",))
+            if not prefix and position in self.children:
+                self.tree.insert(item, tk.END, iid=f"stub{position}")  # Lets the entry be opened, see on_open
+
+    def on_open(self, event):
+        item = self.tree.focus()
+        if self.tree.exists(f"stub{item}"):
+            self.tree.delete(f"stub{item}")
+            self.insert_entries(item, self.children[int(item)])
+
+    def schedule_filter(self):
+        # Wait for a pause in typing, the tree is only rebuilt for the last query
+        if self.filter_job:
+            self.window.after_cancel(self.filter_job)
+        self.filter_job = self.window.after(120, self.filter)
+
+    def filter(self):
+        self.filter_job = None
+        self.tree.delete(*self.tree.get_children())
+        if self.query.get().strip():
+            self.insert_entries("", self.outline.search(self.query.get()), prefix="match")
+        else:
+            self.insert_entries("", self.children.get(None, []))
+
+    def focus_first(self):
+        items = self.tree.get_children()
+        if items:
+            self.tree.focus_set()
+            self.tree.focus(items[0])
+            self.tree.selection_set(items[0])
+
+    def selected_position(self):
+        selection = self.tree.selection()
+        return int(selection[0].replace("match", "")) if selection else None
+
+    def on_tree_select(self, event):
+        position = self.selected_position()
+        if position is not None and self.outline.page_of(position) is not None:
+            self.on_select(self.outline.page_of(position))
+
+    def rename_selected(self):
+        position = self.selected_position()
+        if position is None:
+            return
+        title = simpledialog.askstring("Input", "Enter a new name for the bookmark:",
+                                       initialvalue=self.outline.entries[position][1], parent=self.window)
+        if title:
+            self.outline.rename(position, title)
+            self.on_change()
+
+    def remove_selected(self):
+        position = self.selected_position()
+        if position is None:
+            return
+        if messagebox.askyesno("Remove Bookmark", f"Remove '{self.outline.entries[position][1]}'?", parent=self.window):
+            self.outline.remove(position)
+            self.on_change()
@@ -0,0 +1,129 @@
+import bisect
+from tkinter import PhotoImage
+
+import fitz  # PyMuPDF: Page sizes are read from the page tree, without loading the pages
+
+from perf_trace import tracer
+from pixmap_display import pixmap_to_ppm
+from tile_renderer import device_rect
+
+
+PAGE_GAP = 12  # Vertical space between pages, in canvas pixels
+
+
+def page_rotation(document, page_number):
+    # The page's /Rotate, which it can also inherit from a node of the page tree above it
+    xref = document.page_xref(page_number)
+    while xref:
+        kind, value = document.xref_get_key(xref, "Rotate")
+        if kind == "int":
+            return int(value) % 360
+        kind, value = document.xref_get_key(xref, "Parent")
+        xref = int(value.split()[0]) if kind == "xref" else 0
+    return 0
+
+
+def page_rect(document, page_number):
+    # Same as load_page(page_number).rect: the cropbox moved to (0, 0), turned by the page's /Rotate.
+    # page_cropbox alone is neither, it is the unrotated box in the coordinates of the MediaBox.
+    cropbox = document.page_cropbox(page_number)
+    if page_rotation(document, page_number) in (90, 270):
+        return fitz.Rect(0, 0, cropbox.height, cropbox.width)
+    return fitz.Rect(0, 0, cropbox.width, cropbox.height)
+
+
+# All pages of a document stacked vertically on one canvas. The layout comes from the page sizes
+# alone; only the pages within a screen's height of the viewport are rendered, and the images of
+# pages further away are dropped, so memory use does not grow with the length of the document.
+class ContinuousView:
+    def __init__(self, canvas, scheduler):
+        self.canvas = canvas
+        self.scheduler = scheduler
+        self.pdf_path = None
+        self.zoom_factor = 1.0
+        self.rotation = 0
+        self.page_rects = []  # Unzoomed rect of every page
+        self.offsets = []  # Canvas y of the top of every page
+        self.width = 0  # Width of the widest zoomed page
+        self.images = {}  # page number -> PhotoImage of the rendered pages near the viewport
+
+    def layout(self, document, pdf_path, zoom_factor, rotation):
+        self.clear()
+        self.pdf_path = pdf_path
+        self.zoom_factor = zoom_factor
+        self.rotation = rotation
+        self.page_rects = [page_rect(document, page_number) for page_number in range(len(document))]
+
+        self.offsets = []
+        y = 0
+        self.width = 0
+        for rect in self.page_rects:
+            size = device_rect(rect, zoom_factor, rotation)
+            self.offsets.append(y)
+            y += size.height + PAGE_GAP
+            self.width = max(self.width, size.width)
+        self.canvas.config(scrollregion=(0, 0, self.width, max(0, y - PAGE_GAP)))
+
+    def is_laid_out(self, pdf_path, zoom_factor, rotation):
+        return (pdf_path, zoom_factor, rotation) == (self.pdf_path, self.zoom_factor, self.rotation) and self.offsets
+
+    def clear(self):
+        self.canvas.delete("continuous_page")
+        self.images = {}
+        self.offsets = []
+
+    def page_origin(self, page_number):
+        # Canvas position of the top left corner of a page, pages are centred horizontally
+        size = device_rect(self.page_rects[page_number], self.zoom_factor, self.rotation)
+        return (self.width - size.width) / 2, self.offsets[page_number]
+
+    def page_at(self, y):
+        return max(0, bisect.bisect_right(self.offsets, y) - 1)
+
+    def current_page(self):
+        # The page at the middle of the viewport
+        return self.page_at(self.canvas.canvasy(self.canvas.winfo_height() / 2))
+
+    def scroll_to_page(self, page_number):
+        total = self.offsets[-1] + device_rect(self.page_rects[-1], self.zoom_factor, self.rotation).height
+        self.canvas.yview_moveto(self.offsets[page_number] / total)
+        self.refresh()
+
+    def visible_pages(self, margin=None):
+        top = self.canvas.canvasy(0)
+        height = self.canvas.winfo_height()
+        margin = height if margin is None else margin  # Render a screen ahead in both directions
+        return range(self.page_at(top - margin), self.page_at(top + height + margin) + 1)
+
+    def refresh(self):
+        if not self.offsets:
+            return
+
+        pages = self.visible_pages()
+        for page_number in [p for p in self.images if p not in pages]:
+            self.canvas.delete(f"continuous_page_{page_number}")  # Free pages far from the viewport
+            del self.images[page_number]
+
+        # Nearest to the viewport first
+        current = self.current_page()
+        missing = sorted((p for p in pages if p not in self.images), key=lambda p: abs(p - current))
+        self.scheduler.submit_pages(self.pdf_path, missing, self.zoom_factor, self.rotation, self.display)
+
+    def reload_pages(self, pages):
+        for page_number in pages:
+            self.canvas.delete(f"continuous_page_{page_number}")
+            self.images.pop(page_number, None)
+        self.refresh()
+
+    def display(self, page_number, pix):
+        if page_number in self.images or page_number not in self.visible_pages():
+            return
+
+        data = pixmap_to_ppm(pix)
+        with tracer.span("photo_image", page=page_number):
+            img = PhotoImage(data=data, format="PPM")
+        self.images[page_number] = img  # Keep a reference to avoid garbage collection
+        x, y = self.page_origin(page_number)
+        self.canvas.create_image(x, y, image=img, anchor='nw',
+                                 tags=("continuous_page", f"continuous_page_{page_number}"))
+        self.canvas.tag_raise("highlight")
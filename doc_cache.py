@@ -0,0 +1,70 @@
+import functools
+import hashlib
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+import fitz  # PyMuPDF: Read-only document handles for background work
+
+
+# Directory for data derived from documents (search indexes, thumbnails, ...), shared by all files
+CACHE_DIR = os.environ.get("PDFVIEWER_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "pdfviewer"))
+
+_hashes = {}  # (path, mtime, size) -> hex digest, so a file is only hashed once per change
+_worker_handle = (None, None)  # (path, mtime, size), document: the handle of a worker process
+
+
+def cache_path(*parts):
+    path = os.path.join(CACHE_DIR, *parts)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
+
+
+def document_hash(pdf_path, chunk_size=1024 * 1024):
+    # Content hash of a file, so cached data follows the document across renames and copies
+    stat = os.stat(pdf_path)
+    stamp = (os.path.abspath(pdf_path), stat.st_mtime_ns, stat.st_size)
+    if stamp not in _hashes:
+        digest = hashlib.sha256()
+        with open(pdf_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                digest.update(chunk)
+        _hashes[stamp] = digest.hexdigest()
+    return _hashes[stamp]
+
+
+def background_pool(workers=1, initializer=None, initargs=()):
+    # Process pool for rasterizing, text extraction and other document work started from the viewer.
+    # PyMuPDF holds the GIL for the whole of a call like get_pixmap, so on a thread of the viewer's
+    # process it would still freeze the Tk event loop. Workers are spawned rather than forked, a fork
+    # of a process running Tk and threads is not safe.
+    return ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn"),
+                               initializer=initializer, initargs=initargs)
+
+
+def worker_task(function):
+    # Decorator for functions run in a background_pool. MuPDF's exceptions cannot be pickled, so without
+    # this the viewer would only get a TypeError about pickling instead of the actual error.
+    @functools.wraps(function)
+    def wrapper(*args):
+        try:
+            return function(*args)
+        except Exception as e:
+            raise RuntimeError(str(e)) from None
+    return wrapper
+
+
+def worker_document(pdf_path):
+    # Document handle of the calling worker process, reopened when the path changes or the file is rewritten.
+    # Opened by file name, not memory-mapped: a mapped file that is truncated or rewritten in place (by
+    # another program saving over it) kills the process with SIGBUS, MuPDF only raises an error.
+    global _worker_handle
+    stat = os.stat(pdf_path)
+    stamp = (pdf_path, stat.st_mtime_ns, stat.st_size)
+    handle_stamp, document = _worker_handle
+    if handle_stamp != stamp:
+        if document:
+            document.close()
+        document = fitz.open(pdf_path)
+        _worker_handle = (stamp, document)
+    return document
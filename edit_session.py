@@ -0,0 +1,68 @@
+import fitz  # PyMuPDF: Edits are applied to the open document and saved incrementally
+
+import pdf_engine
+
+
+# Collects edits made to the open fitz.Document and writes them out in one go.
+# Nothing touches the disk until save() is called, and when the file allows it
+# only the changed objects are appended to it instead of rewriting the whole file.
+class EditSession:
+    def __init__(self, document, pdf_path):
+        self.document = document
+        self.pdf_path = pdf_path
+        self.dirty_pages = set()  # Pages with edits that are not saved yet
+        self.outline = None  # Outline entries to write on the next save, None if unchanged
+
+    @property
+    def dirty(self):
+        return bool(self.dirty_pages) or self.outline is not None
+
+    def can_save_incrementally(self):
+        return self.document.can_save_incrementally()
+
+    def add_text_annotation(self, page_number, rect, text, fontsize=12):
+        page = self.document.load_page(page_number)
+        page.add_freetext_annot(rect, text, fontsize=fontsize, rotate=0)
+        self.dirty_pages.add(page_number)
+
+    def add_highlights(self, page_number, rects):
+        page = self.document.load_page(page_number)
+        for rect in rects:
+            highlight = page.add_highlight_annot(rect)
+            highlight.update()
+        self.dirty_pages.add(page_number)
+
+    def insert_image(self, page_number, rect, image_path):
+        page = self.document.load_page(page_number)
+        page.insert_image(rect, filename=image_path)
+        self.dirty_pages.add(page_number)
+
+    def apply_stamps(self, stamps):
+        # stamps as returned by pdf_engine.load_stamp_spec, returns the pages they were put on
+        pages = pdf_engine.apply_stamps(self.document, stamps)
+        self.dirty_pages |= pages
+        return pages
+
+    def set_outline(self, entries):
+        # entries as kept by bookmarks.Outline, [level, title, page, ...]. Rebuilding the outline objects
+        # takes a while on long outlines, so it happens once on save instead of after every change.
+        # Only the outline objects change, so an incremental save appends them without touching any page.
+        self.outline = entries
+
+    def save(self, output_path=None):
+        # Saves the pending edits and returns the pages they were on.
+        # Without an output path the edits are appended to the opened file.
+        if self.outline is not None:
+            self.document.set_toc(self.outline)
+
+        if output_path in (None, self.pdf_path):
+            if not self.can_save_incrementally():
+                raise ValueError("This PDF cannot be saved incrementally, save it under a new name instead.")
+            self.document.save(self.pdf_path, incremental=True, encryption=fitz.PDF_ENCRYPT_KEEP)
+        else:
+            self.document.save(output_path, garbage=1, deflate=True)  # Full rewrite to a new file
+
+        saved_pages = self.dirty_pages
+        self.dirty_pages = set()
+        self.outline = None
+        return saved_pages
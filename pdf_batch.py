@@ -0,0 +1,303 @@
+# Command line for the operations in pdf_engine.py, without any GUI.
+#
+#   python pdf_batch.py merge merged.pdf a.pdf b.pdf
+#   python pdf_batch.py merge --streaming merged.pdf scans/*.pdf
+#   python pdf_batch.py split book.pdf 1-3,4-5 part1.pdf part2.pdf
+#   python pdf_batch.py --workers 8 split archive.pdf "every 100" --template "parts/{stem}_{index:04d}.pdf"
+#   python pdf_batch.py split manual.pdf outline --template "{index:02d}_{title}.pdf"
+#   python pdf_batch.py encrypt in.pdf out.pdf --password secret
+#   python pdf_batch.py --workers 8 crypt encrypt archive/ --method aes-128 --output-dir encrypted/
+#   python pdf_batch.py crypt encrypt --files-from list.txt --old-password old --password new   # in place
+#   python pdf_batch.py --workers 8 stamp confidential.json archive/ --output-dir stamped/
+#   python pdf_batch.py batch jobs.jsonl --workers 8 --report failures.json
+#
+# A manifest is a JSON list of jobs, or one JSON job per line, for example
+#   {"op": "encrypt", "input": "in.pdf", "output": "out.pdf", "password": "secret"}
+#   {"op": "merge", "inputs": ["a.pdf", "b.pdf"], "output": "ab.pdf", "streaming": true}
+#   {"op": "crypt", "action": "decrypt", "input": "in.pdf", "output": "in.pdf", "password": "secret"}
+#   {"op": "stamp", "input": "in.pdf", "output": "out.pdf", "spec": "stamps.json"}
+# See pdf_engine.load_stamp_spec for the format of a stamp spec.
+# Jobs run in a process pool and each one is timed; failed jobs are listed in the report.
+import argparse
+import getpass
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pdf_engine
+
+
+def _ranges(job):
+    ranges = job["ranges"]
+    return pdf_engine.parse_ranges(ranges) if isinstance(ranges, str) else [tuple(r) for r in ranges]
+
+
+def _split(job):
+    if "outputs" in job:
+        return pdf_engine.split_pdf(job["input"], _ranges(job), job["outputs"])
+    # Parts are written in this process unless the job asks for more workers. A template is relative to
+    # the current directory like every other path of a job, without one the parts go next to the input.
+    template = os.path.abspath(job["template"]) if job.get("template") else "{stem}_{index:03d}.pdf"
+    return pdf_engine.split_document(job["input"], job.get("rule") or job["ranges"], template,
+                                     job.get("workers", 1))
+
+
+def _merge(job):
+    if job.get("streaming"):
+        return pdf_engine.stream_merge_pdfs(job["inputs"], job["output"], job.get("batch_size", 20))
+    return pdf_engine.merge_pdfs(job["inputs"], job["output"])
+
+
+OPERATIONS = {
+    "merge": _merge,
+    "split": _split,
+    "encrypt": lambda job: pdf_engine.encrypt_pdf(job["input"], job["output"], job["password"],
+                                                  job.get("method", "aes-256")),
+    "decrypt": lambda job: pdf_engine.decrypt_pdf(job["input"], job["output"], job["password"]),
+    "rotate": lambda job: pdf_engine.rotate_page(job["input"], job["output"], job.get("page", 1) - 1,
+                                                 job.get("angle", 90)),
+    # Like encrypt/decrypt, but files already in the target state are skipped
+    "crypt": lambda job: pdf_engine.crypt_pdf(job["input"], job.get("output", job["input"]), job["password"],
+                                              job.get("action", "encrypt"), job.get("method", "aes-256"),
+                                              job.get("old_password")),
+    "stamp": lambda job: pdf_engine.stamp_pdf(job["input"], job.get("output", job["input"]),
+                                              job.get("stamps") or pdf_engine.load_stamp_spec(job["spec"])),
+}
+
+
+def run_job(job):
+    # Runs in a worker process and never raises, so one bad file does not stop the batch
+    result = {"id": job.get("id"), "op": job.get("op")}
+    start = time.perf_counter()
+    try:
+        if job.get("op") not in OPERATIONS:
+            raise ValueError(f"Unknown operation {job.get('op')!r}.")
+        stats = OPERATIONS[job["op"]](job)
+        if stats:
+            result["stats"] = stats  # e.g. bytes written and pages per second of a streaming merge
+        result["ok"] = True
+    except Exception as e:
+        result["ok"] = False
+        result["error"] = f"{type(e).__name__}: {e}"
+    result["seconds"] = round(time.perf_counter() - start, 4)
+    return result
+
+
+def load_manifest(path):
+    with (sys.stdin if path == "-" else open(path)) as f:
+        text = f.read()
+    if text.lstrip().startswith('['):
+        return json.loads(text)
+    return [json.loads(line) for line in text.splitlines() if line.strip()]  # JSON lines
+
+
+def run_jobs(jobs, workers=None):
+    for index, job in enumerate(jobs):
+        job.setdefault("id", index)
+
+    if workers == 1 or len(jobs) <= 1:
+        return [run_job(job) for job in jobs]  # Not worth starting a pool
+
+    workers = workers or os.cpu_count() or 1
+    chunksize = max(1, len(jobs) // (workers * 4))  # Fewer round trips for thousands of small jobs
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(run_job, jobs, chunksize=chunksize))
+
+
+def summarize(results, elapsed):
+    failures = [result for result in results if not result["ok"]]
+    times = sorted(result["seconds"] for result in results)
+    return {
+        "jobs": len(results),
+        "succeeded": len(results) - len(failures),
+        "failed": len(failures),
+        "elapsed_seconds": round(elapsed, 3),
+        "jobs_per_second": round(len(results) / elapsed, 2) if elapsed else None,
+        "slowest_job_seconds": times[-1] if times else None,
+        "failures": failures,
+    }
+
+
+def find_pdfs(paths, files_from=None):
+    # (input path, path relative to the output directory) of every PDF given directly, found under a
+    # given directory or listed one per line in the files_from file ("-" for stdin)
+    paths = list(paths)
+    if files_from:
+        with (sys.stdin if files_from == "-" else open(files_from)) as f:
+            paths.extend(line.strip() for line in f if line.strip())
+
+    found = []
+    for path in paths:
+        if not os.path.isdir(path):
+            found.append((path, os.path.basename(path)))
+            continue
+        for folder, _, names in os.walk(path):
+            for name in sorted(names):
+                if name.lower().endswith(".pdf"):
+                    found.append((os.path.join(folder, name), os.path.relpath(os.path.join(folder, name), path)))
+    return found
+
+
+def output_paths(found, output_dir=None):
+    # (input path, output path) for the files of find_pdfs, written under output_dir or in place.
+    # Two jobs writing the same file would race on its .part file or silently overwrite each other's
+    # result (a/x.pdf and b/x.pdf both given as files map to x.pdf), so that is refused up front.
+    paths = []
+    inputs = {}  # Normalized output path -> the input written there
+    for input_path, relative_path in found:
+        output_path = os.path.join(output_dir, relative_path) if output_dir else input_path
+        key = os.path.normcase(os.path.abspath(output_path))
+        if key in inputs:
+            raise ValueError(f"{inputs[key]} and {input_path} would both be written to {output_path}.")
+        inputs[key] = input_path
+        paths.append((input_path, output_path))
+    return paths
+
+
+def crypt_summary(results, elapsed):
+    # Throughput of a bulk crypt run, counting only the files that were actually rewritten
+    stats = [result["stats"] for result in results if result["ok"]]
+    written = [s for s in stats if not s["skipped"]]
+    megabytes = sum(s["bytes_in"] for s in written) / (1024 * 1024)
+    pages = sum(s["pages"] for s in written)
+    return {
+        "files": len(results),
+        "written": len(written),
+        "skipped": len(stats) - len(written),
+        "failed": len(results) - len(stats),
+        "megabytes": round(megabytes, 1),
+        "files_per_second": round(len(written) / elapsed, 2) if elapsed else None,
+        "megabytes_per_second": round(megabytes / elapsed, 2) if elapsed else None,
+        "pages_per_second": round(pages / elapsed, 1) if elapsed else None,
+    }
+
+
+def _password(args):
+    return args.password if args.password is not None else getpass.getpass("PDF password: ")
+
+
+def build_jobs(args):
+    if args.command == "batch":
+        jobs = load_manifest(args.manifest)
+        if args.password is not None:
+            for job in jobs:
+                job.setdefault("password", args.password)
+        return jobs
+    if args.command == "merge":
+        return [{"op": "merge", "inputs": args.inputs, "output": args.output, "streaming": args.streaming}]
+    if args.command == "split":
+        if args.outputs:
+            return [{"op": "split", "input": args.input, "ranges": args.rule, "outputs": args.outputs}]
+        return [{"op": "split", "input": args.input, "rule": args.rule, "template": args.template,
+                 "workers": args.workers}]
+    if args.command == "crypt":
+        password = _password(args)
+        return [{"op": "crypt", "action": args.action, "input": input_path, "output": output_path,
+                 "password": password, "method": args.method, "old_password": args.old_password}
+                for input_path, output_path in output_paths(find_pdfs(args.paths, args.files_from), args.output_dir)]
+    if args.command == "stamp":
+        stamps = pdf_engine.load_stamp_spec(args.spec)  # Checked once here rather than failing in every job
+        return [{"op": "stamp", "input": input_path, "stamps": stamps, "output": output_path}
+                for input_path, output_path in output_paths(find_pdfs(args.paths, args.files_from), args.output_dir)]
+    if args.command == "rotate":
+        return [{"op": "rotate", "input": args.input, "output": args.output, "page": args.page, "angle": args.angle}]
+    return [{"op": args.command, "input": args.input, "output": args.output, "password": _password(args)}]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Merge, split, encrypt, decrypt and rotate PDFs without the GUI.")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: one per CPU)")
+    parser.add_argument("--report", help="Write the per-job timings and failures to this JSON file")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    merge = commands.add_parser("merge", help="Merge PDFs into one")
+    merge.add_argument("output")
+    merge.add_argument("inputs", nargs='+')
+    merge.add_argument("--streaming", action="store_true",
+                       help="Bounded memory merge that also shares identical fonts and images between inputs")
+
+    split = commands.add_parser("split", help="Split a PDF into page ranges")
+    split.add_argument("input")
+    split.add_argument("rule", help="Page ranges (e.g. 1-3,4-5), 'every N' or 'outline'")
+    split.add_argument("outputs", nargs='*', help="One output file per range, instead of --template")
+    split.add_argument("--template",
+                       help="Output file names, with {stem} {index} {start} {end} {title}, relative to the "
+                            "current directory (default: {stem}_{index:03d}.pdf next to the input)")
+
+    for name in ("encrypt", "decrypt"):
+        crypt = commands.add_parser(name, help=f"{name.capitalize()} a PDF")
+        crypt.add_argument("input")
+        crypt.add_argument("output")
+        crypt.add_argument("--password", help="Prompted for when not given")
+
+    crypt = commands.add_parser("crypt", help="Encrypt or decrypt many PDFs, skipping those that already are")
+    crypt.add_argument("action", choices=["encrypt", "decrypt"])
+    crypt.add_argument("paths", nargs='*', help="PDF files, or directories to search for PDF files")
+    crypt.add_argument("--files-from", help="File listing one PDF per line, or - to read the list from stdin")
+    crypt.add_argument("--output-dir", help="Write the results here, keeping the directory layout "
+                                            "(default: replace the input files)")
+    crypt.add_argument("--method", choices=list(pdf_engine.ENCRYPTION_METHODS), default="aes-256")
+    crypt.add_argument("--password", help="Prompted for when not given")
+    crypt.add_argument("--old-password", help="Current password of encrypted inputs, to change it")
+
+    stamp = commands.add_parser("stamp", help="Add the text and image stamps of a JSON spec to many PDFs")
+    stamp.add_argument("spec", help="JSON stamp spec, see pdf_engine.load_stamp_spec")
+    stamp.add_argument("paths", nargs='*', help="PDF files, or directories to search for PDF files")
+    stamp.add_argument("--files-from", help="File listing one PDF per line, or - to read the list from stdin")
+    stamp.add_argument("--output-dir", help="Write the results here, keeping the directory layout "
+                                            "(default: stamp the input files in place)")
+
+    rotate = commands.add_parser("rotate", help="Rotate one page of a PDF")
+    rotate.add_argument("input")
+    rotate.add_argument("output")
+    rotate.add_argument("--page", type=int, default=1, help="Page number, starting at 1")
+    rotate.add_argument("--angle", type=int, default=90, help="Multiple of 90 degrees")
+
+    batch = commands.add_parser("batch", help="Run the jobs of a JSON or JSON lines manifest")
+    batch.add_argument("manifest", help="Manifest file, or - to read it from stdin")
+    batch.add_argument("--password", help="Password for jobs that do not set their own")
+
+    args = parser.parse_args(argv)
+    try:
+        jobs = build_jobs(args)
+    except ValueError as e:
+        parser.error(str(e))  # e.g. a bad stamp spec or two inputs with the same output file
+
+    start = time.perf_counter()
+    results = run_jobs(jobs, args.workers)
+    summary = summarize(results, time.perf_counter() - start)
+
+    for failure in summary["failures"]:
+        print(f"FAILED job {failure['id']} ({failure['op']}): {failure['error']}", file=sys.stderr)
+    print(f"{summary['succeeded']}/{summary['jobs']} jobs succeeded in {summary['elapsed_seconds']} s "
+          f"({summary['jobs_per_second']} jobs/s)")
+
+    if args.command == "crypt":
+        crypt = crypt_summary(results, summary["elapsed_seconds"])
+        summary["crypt"] = crypt
+        print(f"{crypt['written']} files {args.action}ed, {crypt['skipped']} skipped, {crypt['failed']} failed: "
+              f"{crypt['megabytes']} MB at {crypt['megabytes_per_second']} MB/s, {crypt['files_per_second']} files/s, "
+              f"{crypt['pages_per_second']} pages/s")
+
+    if args.command == "stamp":
+        stats = [result["stats"] for result in results if result["ok"]]
+        pages = sum(s["pages"] for s in stats)
+        print(f"{pages} pages stamped in {len(stats)} files "
+              f"({round(pages / summary['elapsed_seconds'], 1) if summary['elapsed_seconds'] else None} pages/s)")
+
+    for result in results:
+        if "stats" in result and args.command not in ("crypt", "stamp"):  # One line per file would bury the summary
+            print(f"Job {result['id']}: " + ", ".join(f"{key} {value}" for key, value in result["stats"].items()
+                                                      if key != "outputs"))
+
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump({"summary": summary, "results": results}, f, indent=2)
+
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,503 @@
+# GUI-free PDF operations used by the viewer and by the batch command line (pdf_batch.py).
+# Nothing in here imports tkinter, so it can run on servers and in worker processes.
+import hashlib
+import json
+import os
+import re
+import time
+
+import fitz  # PyMuPDF: Used for the streaming merge and for splitting
+# PyPDF2 is imported inside the functions that use it, it takes longer to import than the viewer needs to start
+
+from doc_cache import background_pool
+from perf_trace import traced
+
+
+_REFERENCE = re.compile(r"\b(\d+) 0 R\b")  # Indirect object reference in a PDF object's source
+# Keys of a /Resources dictionary; objects made only of these are shared page resources
+_RESOURCE_KEYS = {"Font", "XObject", "ExtGState", "ColorSpace", "Pattern", "Shading", "ProcSet", "Properties"}
+_SHARED_TYPES = {"/Font", "/FontDescriptor", "/ExtGState", "/Encoding"}
+_UNSHARED_TYPES = {"/Page", "/Pages", "/Annot", "/Catalog"}  # Identical copies are still distinct objects
+
+
+def parse_ranges(ranges_str):
+    # "1-3,4-5,7" -> [(1, 3), (4, 5), (7, 7)], page numbers start at 1
+    ranges = []
+    for part in ranges_str.split(','):
+        if '-' in part:
+            start, end = map(int, part.split('-'))
+            ranges.append((start, end))
+        else:
+            num = int(part)
+            ranges.append((num, num))
+    return ranges
+
+
+@traced("merge")
+def merge_pdfs(input_paths, output_path):
+    from PyPDF2 import PdfWriter
+    merger = PdfWriter()  # Create a PdfWriter object
+    try:
+        for pdf in input_paths:  # List of PDFs to merge
+            merger.append(pdf)  # Append each PDF to the merger
+        _replace_output(output_path, merger.write)  # Write the merged PDF to a file
+    finally:
+        merger.close()  # Close the merger
+
+
+def _replace_output(output_path, write):
+    # Calls write(temporary path) and moves the file it wrote over output_path once it is complete, so
+    # an output is never seen half written (it may be one of the inputs, or the file open in the viewer)
+    # and a failed write leaves nothing behind. Windows cannot replace a file that is open, so write has
+    # to close any document it opened on output_path before it returns.
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    tmp_path = output_path + ".part"
+    try:
+        write(tmp_path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)  # Do not leave a partial file behind
+        raise
+    os.replace(tmp_path, output_path)
+
+
+@traced("stream_merge")
+def stream_merge_pdfs(input_paths, output_path, batch_size=20, dedupe=True):
+    # Merges PDFs with bounded memory: after every batch of inputs the new pages are appended to the
+    # output file with an incremental save and the output is reopened, so objects of earlier batches
+    # are only read back from disk if needed. Objects identical to one already in the output (the
+    # same font or image used by many inputs) are replaced by references to the first copy.
+    # Returns statistics about the merge.
+    start = time.perf_counter()
+    seen = {}  # Digest of a shareable object -> its xref in the output
+    counts = {"pages": 0, "duplicates": 0}
+
+    def write(tmp_path):
+        output = fitz.open()
+        try:
+            for batch_start in range(0, len(input_paths), batch_size):
+                for pdf in input_paths[batch_start:batch_start + batch_size]:
+                    first_xref = output.xref_length()
+                    with fitz.open(pdf) as source:
+                        output.insert_pdf(source)
+                        counts["pages"] += len(source)
+                    if dedupe:
+                        counts["duplicates"] += _dedupe_objects(output, first_xref, seen)
+
+                if batch_start == 0:
+                    output.save(tmp_path)  # First batch: create the file the next ones are appended to
+                else:
+                    output.saveIncr()
+                output.close()
+                output = fitz.open(tmp_path)  # Drops everything loaded for the batch just written
+        finally:
+            output.close()
+
+    _replace_output(output_path, write)
+    seconds = time.perf_counter() - start
+    pages = counts["pages"]
+    return {
+        "files": len(input_paths),
+        "pages": pages,
+        "bytes_written": os.path.getsize(output_path),
+        "duplicates_removed": counts["duplicates"],
+        "seconds": round(seconds, 3),
+        "pages_per_second": round(pages / seconds, 1) if seconds else None,
+    }
+
+
+def _is_shareable(document, xref, source):
+    # Objects that can safely be used by several pages. Pages, annotations and the like cannot.
+    # Only the object's own /Type counts: a page with inline resources contains "/Type/Font" too.
+    object_type = document.xref_get_key(xref, "Type")[1]
+    if object_type in _UNSHARED_TYPES:
+        return False
+    if document.xref_is_stream(xref) or source.startswith('['):
+        return True
+    if object_type in _SHARED_TYPES:
+        return True
+    keys = document.xref_get_keys(xref)
+    return bool(keys) and set(keys) <= _RESOURCE_KEYS
+
+
+def _dedupe_objects(document, first_xref, seen):
+    # Maps every shareable object from first_xref on to the first identical object in the document.
+    # Objects that only differ in the references to duplicates are identical too, so this repeats until
+    # nothing new is found (e.g. an image becomes a duplicate once its /SMask is found to be one).
+    mapping = {}
+    stream_digests = {}
+
+    def resolve(match):
+        xref = int(match.group(1))
+        while xref in mapping:  # A first copy found in one pass can turn out to be a duplicate in the next
+            xref = mapping[xref]
+        return f"{xref} 0 R"
+
+    candidates = []
+    for xref in range(first_xref, document.xref_length()):
+        source = document.xref_object(xref, compressed=True)
+        if _is_shareable(document, xref, source):
+            candidates.append(xref)
+            if document.xref_is_stream(xref):
+                stream_digests[xref] = hashlib.sha1(document.xref_stream_raw(xref)).digest()
+
+    changed = True
+    while changed:
+        changed = False
+        found = {}  # Digests of this pass; an object's digest changes when it gets rewritten
+        for xref in candidates:
+            if xref in mapping:
+                continue
+            source = _REFERENCE.sub(resolve, document.xref_object(xref, compressed=True))
+            key = hashlib.sha1(source.encode() + stream_digests.get(xref, b"")).digest()
+            canonical = seen.get(key) or found.setdefault(key, xref)
+            if canonical != xref:
+                mapping[xref] = canonical
+                changed = True
+    seen.update(found)  # The last pass found no duplicates, so these are the final digests
+
+    if mapping:
+        # Point every new object at the first copies, then free the duplicates
+        for xref in range(first_xref, document.xref_length()):
+            if xref in mapping:
+                continue
+            source = document.xref_object(xref, compressed=True)
+            rewritten = _REFERENCE.sub(resolve, source)
+            if rewritten != source:
+                document.update_object(xref, rewritten)
+        for xref in mapping:
+            if xref in stream_digests:
+                document.update_stream(xref, b"")
+            document.update_object(xref, "null")
+
+    return len(mapping)
+
+
+def parse_split_rule(rule_str):
+    # "1-3,4-5" -> ("ranges", [(1, 3), (4, 5)]), "every 10" or "every:10" -> ("every", 10), "outline" -> ("outline", None)
+    rule_str = rule_str.strip().lower()
+    if rule_str == "outline":
+        return "outline", None
+    if rule_str.startswith("every"):
+        size = int(rule_str[len("every"):].strip(" :="))
+        if size < 1:
+            raise ValueError("The number of pages per part must be at least 1.")
+        return "every", size
+    return "ranges", parse_ranges(rule_str)
+
+
+def plan_split(document, rule):
+    # Turns a split rule into a list of (start, end, title) parts, page numbers start at 1 and are inclusive
+    kind, value = parse_split_rule(rule) if isinstance(rule, str) else rule
+    page_count = len(document)
+
+    if kind == "every":
+        return [(start, min(start + value - 1, page_count), "") for start in range(1, page_count + 1, value)]
+
+    if kind == "outline":
+        # One part per top-level outline entry, plus one for any pages before the first entry
+        chapters = sorted((page, title) for level, title, page, *_ in document.get_toc(simple=True)
+                          if level == 1 and 1 <= page <= page_count)
+        if not chapters:
+            raise ValueError("The document has no top-level outline entries to split by.")
+        if chapters[0][0] > 1:
+            chapters.insert(0, (1, "front matter"))
+        parts = []
+        for i, (start, title) in enumerate(chapters):
+            end = chapters[i + 1][0] - 1 if i + 1 < len(chapters) else page_count
+            if end >= start:  # Entries pointing at the same page do not get empty parts
+                parts.append((start, end, title))
+        return parts
+
+    for start, end in value:
+        if start < 1 or end > page_count or start > end:
+            raise ValueError(f"Invalid page range {start}-{end} for a document of {page_count} pages.")
+    return [(start, end, "") for start, end in value]
+
+
+def split_output_path(template, input_path, index, start, end, title):
+    # Fields of an output filename template: {stem} of the input file, {index} of the part (from 1),
+    # its {start} and {end} page and the {title} of its outline entry. Relative names go next to the input.
+    stem = os.path.splitext(os.path.basename(input_path))[0]
+    safe_title = re.sub(r'[^\w\- ]+', '', title).strip().replace(' ', '_') or f"part{index}"
+    name = template.format(stem=stem, index=index, start=start, end=end, title=safe_title)
+    return os.path.join(os.path.dirname(os.path.abspath(input_path)), name)
+
+
+_split_source = None  # The document a split worker process copies its parts from
+
+
+def _open_split_source(input_path):
+    global _split_source
+    _split_source = fitz.open(input_path)  # Parsed once per worker, not once per part
+
+
+def _write_part(part):
+    start, end, output_path = part
+    with fitz.open() as output:
+        output.insert_pdf(_split_source, from_page=start - 1, to_page=end - 1)
+        _replace_output(output_path, output.save)
+    return os.path.getsize(output_path)
+
+
+def _write_parts(input_path, parts, workers=None):
+    # parts are (start, end, output path). With one worker everything happens in this process,
+    # otherwise each worker process opens the source once and writes its share of the parts.
+    if workers == 1 or len(parts) <= 1:
+        _open_split_source(input_path)
+        try:
+            return [_write_part(part) for part in parts]
+        finally:
+            _split_source.close()
+
+    workers = min(workers or os.cpu_count() or 1, len(parts))
+    # Spawned workers, the viewer calls this from a process with threads running that a fork would copy
+    with background_pool(workers, _open_split_source, (input_path,)) as executor:
+        return list(executor.map(_write_part, parts, chunksize=max(1, len(parts) // (workers * 4))))
+
+
+@traced("split")
+def split_pdf(input_path, ranges, output_paths):
+    # Writes the pages of every (start, end) range, both inclusive, to the output path at the same position
+    with fitz.open(input_path) as document:
+        parts = plan_split(document, ("ranges", list(ranges)))
+    _write_parts(input_path, [(start, end, path) for (start, end, _), path in zip(parts, output_paths)], workers=1)
+
+
+@traced("split")
+def split_document(input_path, rule, output_template="{stem}_{index:03d}.pdf", workers=None):
+    # Splits by a rule (see parse_split_rule) into files named by output_template (see split_output_path).
+    # The source is parsed once to plan the parts, which are then written in parallel. Returns statistics.
+    start_time = time.perf_counter()
+    with fitz.open(input_path) as document:
+        parts = [(start, end, split_output_path(output_template, input_path, index, start, end, title))
+                 for index, (start, end, title) in enumerate(plan_split(document, rule), 1)]
+
+    if len({path for _, _, path in parts}) < len(parts):
+        raise ValueError("The output template gives several parts the same file name, add {index} to it.")
+
+    sizes = _write_parts(input_path, parts, workers)
+    seconds = time.perf_counter() - start_time
+    pages = sum(end - start + 1 for start, end, _ in parts)
+    return {
+        "parts": len(parts),
+        "pages": pages,
+        "bytes_written": sum(sizes),
+        "outputs": [path for _, _, path in parts],
+        "seconds": round(seconds, 3),
+        "pages_per_second": round(pages / seconds, 1) if seconds else None,
+    }
+
+
+ENCRYPTION_METHODS = {
+    "aes-128": (fitz.PDF_ENCRYPT_AES_128, "128-bit AES"),  # Name -> (MuPDF method, as in metadata["encryption"])
+    "aes-256": (fitz.PDF_ENCRYPT_AES_256, "256-bit AES"),
+}
+
+
+def crypt_pdf(input_path, output_path, password, action="encrypt", method="aes-256", old_password=None,
+              skip_done=True):
+    # Encrypts or decrypts a PDF with MuPDF, which copies the objects to the output one at a time instead
+    # of rebuilding every page. The output is written to a temporary file that replaces it once complete,
+    # so a file can be its own output. Files already in the target state (encrypted with this method and
+    # password, or not encrypted) are skipped when skip_done is set. An encrypted input is opened with
+    # old_password, or with password if that is not given, which also allows changing the password.
+    # Returns statistics, "skipped" tells whether anything was written.
+    if action not in ("encrypt", "decrypt"):
+        raise ValueError(f"Unknown action {action!r}, expected 'encrypt' or 'decrypt'.")
+    if action == "encrypt" and method not in ENCRYPTION_METHODS:
+        raise ValueError(f"Unknown encryption method {method!r}, expected one of {', '.join(ENCRYPTION_METHODS)}.")
+
+    start = time.perf_counter()
+    bytes_in = os.path.getsize(input_path)
+    document = fitz.open(input_path)
+    try:
+        pages = len(document)
+        locked = document.needs_pass  # Read before authenticating, reading it afterwards breaks decryption on save
+        if locked and not document.authenticate(old_password or password):
+            raise ValueError("Incorrect password.")
+        encryption = document.metadata.get("encryption") or ""  # Empty when the file is not encrypted
+
+        if action == "encrypt":
+            done = locked and not old_password and ENCRYPTION_METHODS[method][1] in encryption
+        else:
+            done = not encryption
+        if done and skip_done:
+            return {"skipped": True, "pages": pages, "bytes_in": bytes_in, "bytes_written": 0,
+                    "seconds": round(time.perf_counter() - start, 3)}
+
+        def write(tmp_path):
+            try:
+                if action == "encrypt":
+                    document.save(tmp_path, encryption=ENCRYPTION_METHODS[method][0], user_pw=password,
+                                  owner_pw=password)
+                else:
+                    document.save(tmp_path, encryption=fitz.PDF_ENCRYPT_NONE)
+            finally:
+                document.close()  # Before the output is replaced, it may be the input
+
+        _replace_output(output_path, write)
+    finally:
+        if not document.is_closed:
+            document.close()
+
+    return {
+        "skipped": False,
+        "pages": pages,
+        "bytes_in": bytes_in,
+        "bytes_written": os.path.getsize(output_path),
+        "seconds": round(time.perf_counter() - start, 3),
+    }
+
+
+@traced("encrypt")
+def encrypt_pdf(input_path, output_path, password, method="aes-256"):
+    return crypt_pdf(input_path, output_path, password, "encrypt", method, skip_done=False)
+
+
+def check_password(input_path, password):
+    with fitz.open(input_path) as document:
+        return not document.needs_pass or bool(document.authenticate(password))
+
+
+@traced("decrypt")
+def decrypt_pdf(input_path, output_path, password):
+    return crypt_pdf(input_path, output_path, password, "decrypt", skip_done=False)
+
+
+STAMP_TYPES = ("text", "image")
+_stamp_images = {}  # (image file, mtime, size) -> its bytes, read once per process however many files are stamped
+
+
+def load_stamp_spec(spec_path):
+    # A stamp spec is a JSON list of stamps, or an object with the list under "stamps", for example
+    #   {"type": "image", "file": "logo.png", "rect": [-130, 20, -20, 70], "pages": "all"}
+    #   {"type": "text", "text": "CONFIDENTIAL", "rect": [20, -60, 300, -20], "pages": "1-3,7",
+    #    "fontsize": 18, "color": [1, 0, 0]}
+    # rect is x0, y0, x1, y1 in points; negative numbers count from the right or bottom edge of the page.
+    # pages is "all" (the default), "odd", "even", ranges like "1-3,7" or a list of page numbers.
+    # Image files are relative to the spec. Returns the list of stamps, checked: every problem with the
+    # spec raises a ValueError here instead of failing each file it is applied to.
+    try:
+        with open(spec_path) as f:
+            spec = json.load(f)  # json.JSONDecodeError is a ValueError too
+    except OSError as e:
+        raise ValueError(f"Cannot read the stamp spec: {e}") from None
+    stamps = spec.get("stamps") if isinstance(spec, dict) else spec
+    if not isinstance(stamps, list) or not all(isinstance(stamp, dict) for stamp in stamps):
+        raise ValueError("A stamp spec is a list of stamps, or an object with that list under \"stamps\".")
+
+    for number, stamp in enumerate(stamps, 1):
+        if stamp.get("type") not in STAMP_TYPES:
+            raise ValueError(f"Stamp {number}: type has to be one of {', '.join(STAMP_TYPES)}.")
+        rect = stamp.get("rect")
+        if not isinstance(rect, list) or len(rect) != 4 or \
+                not all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in rect):
+            raise ValueError(f"Stamp {number}: rect has to be [x0, y0, x1, y1], in points.")
+        try:
+            stamp_pages(stamp.get("pages", "all"), 0)  # Only parses the selection
+        except (TypeError, ValueError):
+            raise ValueError(f"Stamp {number}: pages has to be \"all\", \"odd\", \"even\", ranges like "
+                             f"\"1-3,7\" or a list of page numbers, not {stamp.get('pages')!r}.") from None
+        if stamp["type"] == "image":
+            if not isinstance(stamp.get("file"), str):
+                raise ValueError(f"Stamp {number}: image stamps need a file.")
+            stamp["file"] = os.path.join(os.path.dirname(os.path.abspath(spec_path)), stamp["file"])
+            if not os.path.isfile(stamp["file"]):
+                raise ValueError(f"Stamp {number}: image file {stamp['file']} does not exist.")
+        elif not stamp.get("text"):
+            raise ValueError(f"Stamp {number}: text stamps need a text.")
+    return stamps
+
+
+def stamp_pages(pages, page_count):
+    # Zero-based page numbers selected by a stamp's "pages", see load_stamp_spec
+    if pages == "all":
+        return range(page_count)
+    if pages in ("odd", "even"):
+        return range(0 if pages == "odd" else 1, page_count, 2)
+    if isinstance(pages, str):
+        selected = [n for start, end in parse_ranges(pages) for n in range(start, end + 1)]
+    else:
+        selected = pages
+    return [n - 1 for n in selected if 1 <= n <= page_count]
+
+
+def _stamp_rect(page, rect):
+    width, height = page.rect.width, page.rect.height
+    x0, y0, x1, y1 = (v + (size if v < 0 else 0) for v, size in zip(rect, (width, height, width, height)))
+    return fitz.Rect(x0, y0, x1, y1)
+
+
+def apply_stamps(document, stamps):
+    # Adds the stamps to the open document and returns the pages they were put on. Each image is
+    # embedded on the first page that gets it; every other page references that same image object.
+    stamped = set()
+    for stamp in stamps:
+        xref = 0
+        for page_number in stamp_pages(stamp.get("pages", "all"), len(document)):
+            page = document.load_page(page_number)
+            rect = _stamp_rect(page, stamp["rect"])
+            if stamp["type"] == "image":
+                if not xref:
+                    stat = os.stat(stamp["file"])
+                    key = (stamp["file"], stat.st_mtime_ns, stat.st_size)
+                    if key not in _stamp_images:
+                        with open(stamp["file"], 'rb') as f:
+                            _stamp_images[key] = f.read()
+                    xref = page.insert_image(rect, stream=_stamp_images[key],
+                                             keep_proportion=stamp.get("keep_proportion", True))
+                else:
+                    page.insert_image(rect, xref=xref, keep_proportion=stamp.get("keep_proportion", True))
+            else:
+                page.add_freetext_annot(rect, stamp["text"], fontsize=stamp.get("fontsize", 12),
+                                        text_color=stamp.get("color"), opacity=stamp.get("opacity", 1))
+            stamped.add(page_number)
+    return stamped
+
+
+def stamp_pdf(input_path, output_path, stamps):
+    # Stamps a file with one save at the end. Stamping a file in place appends the changes with an
+    # incremental save where the file allows it, otherwise the output is written to a temporary file
+    # first. Returns statistics.
+    start = time.perf_counter()
+    in_place = os.path.abspath(output_path) == os.path.abspath(input_path)
+    document = fitz.open(input_path)
+    try:
+        pages = apply_stamps(document, stamps)
+        incremental = in_place and bool(document.can_save_incrementally())
+        if incremental:
+            document.save(input_path, incremental=True, encryption=fitz.PDF_ENCRYPT_KEEP)
+        else:
+            def write(tmp_path):
+                try:
+                    document.save(tmp_path, garbage=1, deflate=True)
+                finally:
+                    document.close()  # Before the output is replaced, it may be the input
+
+            _replace_output(output_path, write)
+    finally:
+        if not document.is_closed:
+            document.close()
+
+    return {
+        "pages": len(pages),
+        "stamps": len(stamps),
+        "incremental": incremental,
+        "bytes_written": os.path.getsize(output_path),
+        "seconds": round(time.perf_counter() - start, 3),
+    }
+
+
+def rotate_page(input_path, output_path, page_number, angle=90):
+    # page_number starts at 0, like the viewer's page_number
+    from PyPDF2 import PdfReader, PdfWriter
+    reader = PdfReader(input_path)  # Create PdfReader object
+    writer = PdfWriter()  # Create PdfWriter object
+
+    for i, page in enumerate(reader.pages):
+        if i == page_number:
+            page.rotate(angle)  # Rotate the page by the given multiple of 90 degrees
+        writer.add_page(page)  # Add the page to the writer
+
+    _replace_output(output_path, writer.write)  # Write the rotated PDF to a file
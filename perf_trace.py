@@ -0,0 +1,100 @@
+import functools
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import nullcontext
+
+
+TRACE_ENV = "PDFVIEWER_TRACE"  # Set to a file name to trace from startup and write the trace there on exit
+MAX_EVENTS = 200000  # Oldest events are dropped beyond this, so a long session cannot grow without bound
+
+_NO_SPAN = nullcontext()
+
+
+class _Span:
+    def __init__(self, tracer, name, category, args):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.tracer.add(self.name, self.category, self.start, time.perf_counter(), self.args)
+
+
+# Opt-in timing of the stages of rendering and of the document operations. Disabled it costs one
+# attribute check per stage. Events are kept in memory and exported in the Chrome trace format,
+# which chrome://tracing and https://ui.perfetto.dev open directly.
+class Tracer:
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.events = deque(maxlen=MAX_EVENTS)  # (name, category, start, end, thread id, args)
+        self.last = {}  # Stage name -> duration of its latest run in seconds, for the stats overlay
+        self._threads = {}  # Thread id -> thread name, labels the rows of the trace viewer
+        self._origin = time.perf_counter()
+
+    def span(self, name, category="render", **args):
+        # with tracer.span("get_pixmap", page=3): ...
+        if not self.enabled:
+            return _NO_SPAN
+        return _Span(self, name, category, args)
+
+    def add(self, name, category, start, end, args=None, thread=None):
+        # Records a stage that did not run inside one with block, e.g. from a request to its callback.
+        # thread is (id, name) for stages recorded by a worker process, their times are perf_counter()
+        # readings too, which share one clock between processes.
+        if not self.enabled:
+            return
+        if thread is None:
+            thread = threading.current_thread()
+            thread = (thread.ident, thread.name)
+        self._threads[thread[0]] = thread[1]
+        self.events.append((name, category, start, end, thread[0], args))
+        self.last[name] = end - start
+
+    def last_ms(self, name):
+        seconds = self.last.get(name)
+        return None if seconds is None else seconds * 1000
+
+    def clear(self):
+        self.events.clear()
+        self.last.clear()
+
+    def export(self, path):
+        pid = os.getpid()
+        events = [{"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": thread_name}}
+                  for tid, thread_name in list(self._threads.items())]
+        for name, category, start, end, tid, args in list(self.events):
+            events.append({
+                "name": name,
+                "cat": category,
+                "ph": "X",  # Complete event: start and duration, in microseconds
+                "ts": round((start - self._origin) * 1e6, 3),
+                "dur": round((end - start) * 1e6, 3),
+                "pid": pid,
+                "tid": tid,
+                "args": args or {},
+            })
+        with open(path, 'w') as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+        return len(events)
+
+
+tracer = Tracer(enabled=bool(os.environ.get(TRACE_ENV)))  # Shared by the viewer and the modules it uses
+
+
+def traced(name, category="operation"):
+    # Decorator timing every call of a function as one span
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with tracer.span(name, category):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
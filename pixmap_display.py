@@ -0,0 +1,25 @@
+import fitz  # PyMuPDF: Pixmaps are handed to Tk without going through an image encoder
+
+from perf_trace import tracer
+
+
+def pixmap_to_ppm(pix):
+    # A binary PPM/PGM is just a short header followed by the raw samples, which is exactly how
+    # MuPDF stores an RGB or gray pixmap without alpha. So the pixmap buffer is used as is (one copy
+    # to append it to the header) instead of running pix.tobytes("ppm") over every pixel.
+    # Renders are RGB without alpha, other pixmaps are converted first
+    with tracer.span("to_ppm"):
+        if pix.alpha:
+            pix = fitz.Pixmap(pix, 0)
+        if pix.n not in (1, 3):
+            pix = fitz.Pixmap(fitz.csRGB, pix)
+        magic = b"P5" if pix.n == 1 else b"P6"
+        return b"%s\n%d %d\n255\n" % (magic, pix.width, pix.height) + pix.samples_mv
+
+
+def update_photo(photo, pix):
+    # Loads a pixmap into an existing PhotoImage, which takes the pixmap's size. Canvas items showing
+    # the photo are redrawn by Tk, so the page image item never has to be recreated.
+    data = pixmap_to_ppm(pix)
+    with tracer.span("photo_image"):
+        photo.configure(data=data, format="PPM")
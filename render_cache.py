@@ -0,0 +1,85 @@
+import threading
+from collections import OrderedDict
+
+import fitz  # PyMuPDF: Used for rasterizing pages
+
+from perf_trace import tracer
+
+
+RENDER_SCALE = 0.97  # The viewer draws pages at 97% of their zoomed size
+
+
+def render_key(pdf_path, page_number, zoom_factor, rotation):
+    # Round the zoom so that repeated *1.2 / /1.2 steps land on the same key
+    return (pdf_path, page_number, round(zoom_factor, 4), rotation % 360)
+
+
+def page_matrix(zoom_factor, rotation=0):
+    return fitz.Matrix(zoom_factor * RENDER_SCALE, zoom_factor * RENDER_SCALE).prerotate(rotation)
+
+
+def render_page(document, page_number, zoom_factor, rotation=0):
+    with tracer.span("load_page", page=page_number):
+        page = document.load_page(page_number)
+    with tracer.span("get_pixmap", page=page_number, zoom=zoom_factor):
+        return page.get_pixmap(matrix=page_matrix(zoom_factor, rotation))
+
+
+def pixmap_size(pix):
+    return pix.stride * pix.height  # Bytes held by the pixmap samples
+
+
+# Least-recently-used cache of rendered pixmaps, bounded by the total size of their samples
+class RenderCache:
+    def __init__(self, max_bytes=256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()  # Render workers write while the Tk thread reads
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            pix = self._entries.get(key)
+            if pix is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)  # Mark as most recently used
+            self.hits += 1
+            return pix
+
+    def put(self, key, pix):
+        size = pixmap_size(pix)
+        if size > self.max_bytes:
+            return  # Never let a single huge render flush the whole cache
+
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.current_bytes -= pixmap_size(old)
+            self._entries[key] = pix
+            self.current_bytes += size
+
+            while self.current_bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)  # Drop the least recently used entry
+                self.current_bytes -= pixmap_size(evicted)
+
+    def invalidate(self, pdf_path, page_number=None):
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == pdf_path and page_number in (None, k[1])]:
+                self.current_bytes -= pixmap_size(self._entries.pop(key))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
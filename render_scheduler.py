@@ -0,0 +1,170 @@
+import os
+import queue
+from collections import deque
+from concurrent.futures.process import BrokenProcessPool
+
+import fitz  # PyMuPDF: Pixmaps are rebuilt from the samples a worker process sends back
+
+from doc_cache import background_pool, worker_document, worker_task
+from perf_trace import tracer
+from render_cache import render_key, render_page
+from tile_renderer import tile_key, render_tile
+
+
+@worker_task
+def _render_in_worker(render, key, trace):
+    # Runs in a render process. Pixmaps cannot be pickled, so the samples go back as bytes, together
+    # with the stages the worker's tracer recorded for the viewer's trace.
+    tracer.enabled = trace
+    pix = render(worker_document(key[0]), *key[1:])
+    spans = [(name, category, start, end, args) for name, category, start, end, _, args in tracer.events]
+    tracer.clear()
+    return (pix.x, pix.y, pix.width, pix.height, pix.alpha, pix.samples), spans, os.getpid()
+
+
+def _pixmap(x, y, width, height, alpha, samples):
+    pix = fitz.Pixmap(fitz.csRGB, width, height, samples, alpha)
+    pix.set_origin(x, y)  # Tiles are placed by their origin, see tile_renderer.tile_position
+    return pix
+
+
+# Rasterizes pages in worker processes, each with its own document handle, and hands the pixmaps back
+# to the Tk thread. A worker thread would not do: PyMuPDF keeps the GIL for the whole get_pixmap call.
+# Every visible request supersedes the previous ones, and requests only go to a worker once one is
+# free, so a burst of scroll or zoom events only ends up rendering the last page/zoom asked for.
+class RenderScheduler:
+    def __init__(self, master, cache, workers=2, prefetch_distance=2, poll_interval=15):
+        self.master = master  # Tk widget used to run callbacks on the event loop through after()
+        self.cache = cache
+        self.workers = workers
+        self.prefetch_distance = prefetch_distance  # Prefetch pages N-distance .. N+distance
+        self.poll_interval = poll_interval  # Milliseconds between checks for finished renders
+        self.pending = 0  # Requests queued or running, for status display
+
+        self._executor = None  # Started with the first request, the first page is rendered by submit_now
+        self._waiting = deque()  # (generation, key, render, callback) not yet sent to a worker
+        self._running = 0  # Requests sent to a worker and not yet picked up by _poll
+        self._generation = 0  # Bumped by every visible request, older work is dropped
+        self._results = queue.Queue()  # Finished renders waiting to be delivered on the Tk thread
+        self._live_path = None  # Pages of this file with unsaved edits are rendered from _live_document
+        self._live_document = None
+        self._live_pages = frozenset()
+        self.master.after(self.poll_interval, self._poll)
+
+    def submit(self, pdf_path, page_number, zoom_factor, rotation, callback):
+        self._generation += 1  # Supersede every earlier visible and prefetch request
+        self._request(render_key(pdf_path, page_number, zoom_factor, rotation), render_page, callback)
+
+    def submit_now(self, document, pdf_path, page_number, zoom_factor, rotation, callback):
+        # Renders on the calling thread with the caller's document. Used for the first page of a newly
+        # opened file, a worker would first have to open the file and load its page tree all over again.
+        self._generation += 1
+        key = render_key(pdf_path, page_number, zoom_factor, rotation)
+        pix = self.cache.get(key)
+        if pix is None:
+            pix = render_page(document, *key[1:])
+            self.cache.put(key, pix)
+        callback(pix)
+
+    def submit_pages(self, pdf_path, pages, zoom_factor, rotation, callback, supersede=True):
+        # Several whole pages at once, delivered one by one as callback(page number, pix)
+        if supersede:
+            self._generation += 1
+        for page_number in pages:
+            self._request(render_key(pdf_path, page_number, zoom_factor, rotation), render_page,
+                          lambda pix, page_number=page_number: callback(page_number, pix))
+
+    def submit_tiles(self, pdf_path, page_number, zoom_factor, rotation, tiles, callback, supersede=True):
+        # Tiles are delivered one by one as callback((col, row), pix), in the order they were given
+        if supersede:
+            self._generation += 1
+        for tile in tiles:
+            self._request(tile_key(pdf_path, page_number, zoom_factor, rotation, *tile), render_tile,
+                          lambda pix, tile=tile: callback(tile, pix))
+
+    def prefetch(self, pdf_path, page_number, page_count, zoom_factor, rotation=0):
+        # Closest neighbours first, forward before backward since reading usually moves forward
+        for offset in range(1, self.prefetch_distance + 1):
+            for candidate in (page_number + offset, page_number - offset):
+                key = render_key(pdf_path, candidate, zoom_factor, rotation)
+                if 0 <= candidate < page_count and key not in self.cache and not self._is_live(key):
+                    self._queue(self._generation, key, render_page, None)
+
+    def set_live_pages(self, pdf_path, document, pages):
+        # Unsaved edits only exist in the viewer's document, so the workers' handles (opened from the
+        # file on disk) would render these pages without them. They are rendered on the Tk thread instead.
+        self._live_path = pdf_path
+        self._live_document = document
+        self._live_pages = frozenset(pages)
+
+    def _is_live(self, key):
+        return key[0] == self._live_path and key[1] in self._live_pages
+
+    def cancel(self):
+        self._generation += 1  # Queued work is skipped and running work is not delivered
+
+    def _request(self, key, render, callback):
+        pix = self.cache.get(key)
+        if pix is not None:
+            callback(pix)  # Cache hit: no need to go through a worker at all
+        elif self._is_live(key):
+            pix = render(self._live_document, *key[1:])
+            self.cache.put(key, pix)
+            callback(pix)
+        else:
+            self._queue(self._generation, key, render, callback)
+
+    def _queue(self, generation, key, render, callback):
+        self.pending += 1
+        self._waiting.append((generation, key, render, callback))
+        self._dispatch()
+
+    def _dispatch(self):
+        # Sends waiting requests to the workers while one is free, dropping those superseded meanwhile
+        while self._waiting and self._running < self.workers:
+            generation, key, render, callback = self._waiting.popleft()
+            pix = self.cache.get(key) if generation == self._generation else None
+            if generation != self._generation or pix is not None:
+                self.pending -= 1
+                if callback and pix is not None:
+                    callback(pix)  # Rendered meanwhile, e.g. as a prefetch
+                continue
+            try:
+                if self._executor is None:
+                    self._executor = background_pool(self.workers)
+                future = self._executor.submit(_render_in_worker, render, key, tracer.enabled)
+            except BrokenProcessPool:  # A worker died since the last request, start over with a new pool
+                self._executor = background_pool(self.workers)
+                future = self._executor.submit(_render_in_worker, render, key, tracer.enabled)
+            future.add_done_callback(lambda future, request=(generation, key, callback, self._executor):
+                                     self._results.put(request + (future,)))
+            self._running += 1
+
+    def _poll(self):
+        while True:
+            try:
+                generation, key, callback, executor, future = self._results.get_nowait()
+            except queue.Empty:
+                break
+            self.pending -= 1
+            self._running -= 1
+            try:
+                samples, spans, pid = future.result()
+            except BrokenProcessPool:
+                print(f"Rendering page {key[1] + 1} failed: a render process died")
+                if self._executor is executor:
+                    self._executor = None  # Started again for the next request
+                continue
+            except Exception as e:
+                print(f"Rendering page {key[1] + 1} failed: {e}")
+                continue
+
+            for span in spans:
+                tracer.add(*span, thread=(pid, "pdf-render"))
+            pix = _pixmap(*samples)
+            if not self._is_live(key):  # The page was edited while it was being rendered
+                self.cache.put(key, pix)
+            if callback and generation == self._generation:
+                callback(pix)
+        self._dispatch()
+        self.master.after(self.poll_interval, self._poll)
@@ -0,0 +1,127 @@
+import os
+import pickle
+import string
+import threading
+from collections import defaultdict
+
+import fitz  # PyMuPDF: get_text("words") gives every word on a page with its rectangle
+
+from doc_cache import background_pool, cache_path, document_hash, worker_task
+from perf_trace import traced
+
+
+INDEX_VERSION = 1  # Bump when the on-disk layout changes so old indexes are rebuilt
+_STRIP = string.punctuation + "“”‘’«»"
+
+
+def normalize(word):
+    return word.strip(_STRIP).lower()
+
+
+def tokenize(text):
+    return [token for token in (normalize(word) for word in text.split()) if token]
+
+
+# Inverted index of the words of a document: word -> [(page, position)], plus the word rectangles
+# of every page so hits can be highlighted without touching the document again
+class SearchIndex:
+    def __init__(self):
+        self.postings = defaultdict(list)
+        self.pages = []  # For every page, the list of (normalized word, rect tuple) in reading order
+        self._vocabulary = None  # Every distinct word, scanned for the words containing a query
+
+    @classmethod
+    @traced("search_index", "search")
+    def build(cls, document):
+        index = cls()
+        for page_number in range(len(document)):
+            words = []
+            for x0, y0, x1, y1, word, *_ in document.load_page(page_number).get_text("words", sort=True):
+                token = normalize(word)
+                if token:
+                    index.postings[token].append((page_number, len(words)))
+                    words.append((token, (x0, y0, x1, y1)))
+            index.pages.append(words)
+        return index
+
+    @traced("search", "search")
+    def search(self, query):
+        # Returns every hit as (page number, [fitz.Rect of each word]), in document order.
+        # Matches what page.search_for finds while the index is being built: a single word anywhere
+        # inside a word ("mail" in "e-mail"), several words as a phrase, the first one at the end of a
+        # word, the last one at the start of a word and those in between whole.
+        terms = tokenize(query)
+        if not terms:
+            return []
+
+        if self._vocabulary is None:
+            self._vocabulary = list(self.postings)
+        if len(terms) == 1:
+            first_words = [word for word in self._vocabulary if terms[0] in word]
+        else:
+            first_words = [word for word in self._vocabulary if word.endswith(terms[0])]
+
+        hits = []
+        for page_number, position in sorted(entry for word in first_words for entry in self.postings[word]):
+            words = self.pages[page_number][position:position + len(terms)]
+            if len(terms) > 1 and (len(words) < len(terms) or not words[-1][0].startswith(terms[-1])
+                                   or [token for token, _ in words[1:-1]] != terms[1:-1]):
+                continue
+            hits.append((page_number, [fitz.Rect(rect) for _, rect in words]))
+        return hits
+
+    def save(self, path):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump((INDEX_VERSION, dict(self.postings), self.pages), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)  # Never leave a half written index behind
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            version, postings, pages = pickle.load(f)
+        if version != INDEX_VERSION:
+            return None
+        index = cls()
+        index.postings.update(postings)
+        index.pages = pages
+        return index
+
+
+def index_path(pdf_path):
+    return cache_path("search", document_hash(pdf_path) + ".idx")
+
+
+def load_or_build_index(pdf_path):
+    path = index_path(pdf_path)
+    if os.path.exists(path):
+        try:
+            index = SearchIndex.load(path)
+            if index is not None:
+                return index
+        except Exception as e:
+            print(f"Ignoring unreadable search index {path}: {e}")
+
+    with background_pool() as pool:  # Extracting the text on a thread would hold the GIL most of the time
+        pool.submit(build_index_file, pdf_path, path).result()
+    return SearchIndex.load(path)
+
+
+@worker_task
+def build_index_file(pdf_path, path):
+    # Runs in a worker process, the index reaches the viewer through the file in the cache
+    with fitz.open(pdf_path) as document:  # Own handle, the viewer keeps using its document meanwhile
+        SearchIndex.build(document).save(path)
+
+
+# Loads or builds the index of a document on a background thread; callback(index) runs on that thread
+def build_index_in_background(pdf_path, callback):
+    def run():
+        try:
+            callback(load_or_build_index(pdf_path))
+        except Exception as e:
+            print(f"Indexing {pdf_path} failed: {e}")
+
+    thread = threading.Thread(target=run, name="pdf-index", daemon=True)
+    thread.start()
+    return thread
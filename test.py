@@ -1,17 +1,38 @@
+import time
+STARTUP_START = time.perf_counter()  # Taken before the imports below, for the measured startup time
+
+import argparse
 import fitz  # PyMuPDF: Used for opening and manipulating PDF files
 import tkinter as tk  # Tkinter: Used for creating GUI applications in Python
 from tkinter import *  # Import all Tkinter classes and constants
 from tkinter import ttk, filedialog, simpledialog, \
     messagebox  # ttk for themed widgets, filedialog for file selection dialog, simpledialog for input dialogs
-from PyPDF2 import PdfReader, PdfWriter  # PdfReader and PdfWriter: Used for reading and writing PDF files
 import os
 import platform
 import subprocess
+from pixmap_display import pixmap_to_ppm, update_photo
+from render_cache import RenderCache, page_matrix
+from render_scheduler import RenderScheduler
+from continuous_view import ContinuousView
+import pdf_engine  # GUI-free merge/split/encrypt/decrypt/rotate, also used by pdf_batch.py
+from bookmarks import BookmarkPanel, Outline
+from edit_session import EditSession
+from perf_trace import TRACE_ENV, tracer
+from search_index import build_index_in_background
+from text_store import TextStore
+from thumbnails import STRIP_WIDTH, ThumbnailStrip
+from tile_renderer import TILED_ZOOM, device_rect, preview_zoom, tile_position, visible_tiles
+
+AUTOSAVE_DELAY = 30000  # Milliseconds after the last edit before it is saved automatically
+BACKGROUND_LOAD_DELAY = 200  # Milliseconds after opening a file before thumbnails and search index are started
+
+
 # Define a class for our PDF viewer application
 class PDFViewer:
     # Initialization method for the PDFViewer class
     def __init__(self, master):
-        self.bookmarks = {}
+        self.bookmarks = None  # Outline of the loaded document, read from the file when first needed
+        self.bookmark_panel = None
 
         # master refers to the main window of the Tkinter application
         self.master = master
@@ -19,8 +40,29 @@ class PDFViewer:
         self.document = None  # PyMuPDF document object
         self.page_number = 0  # Start displaying from the first page
         self.zoom_factor = 1.0
+        self.rotation = 0  # View rotation in degrees, part of the render cache key
+        self.page_rect = None  # Unzoomed rectangle of the page being displayed
         self.h_scroll = None
 
+        self.render_cache = RenderCache()  # Recently rendered pages, bounded by pixmap bytes
+        self.render_scheduler = RenderScheduler(master, self.render_cache)  # Rasterizes pages off the Tk thread
+        self.tiled_page = None  # Page rect of the page being drawn as tiles at high zoom, None otherwise
+        self.tile_images = {}  # (col, row) -> PhotoImage of the tiles currently on the canvas
+        self.preview_image = None  # Enlarged low resolution placeholder shown until the tiles arrive
+        self.view_refresh_job = None
+
+        self.search_index = None  # Word index of the loaded document, built in the background
+        self.search_hits = []  # (page number, word rects) of every match of the last search
+        self.search_hit_number = 0  # Index into search_hits of the match being shown
+        self.search_hits_by_page = {}  # page number -> [(hit number, word rects)], for drawing overlays
+
+        self.edit_session = None  # Unsaved annotations and images of the loaded document
+        self.text_store = None  # Extracted text of recently viewed pages
+        self.autosave_job = None
+        self.render_started = None  # perf_counter() of the show_page waiting for its render, for the stats overlay
+        self.stats_job = None
+        self.first_page_pending = False  # The file was just opened, its first page is rendered right away
+
         style = ttk.Style()
         style.configure('Main.TFrame', background='#6FEA99')
 
@@ -32,32 +74,53 @@ class PDFViewer:
             ]})
         ])
 
-        self.frm = ttk.Frame(root, padding="3 12 3 12", style='Main.TFrame')
+        self.frm = ttk.Frame(master, padding="3 12 3 12", style='Main.TFrame')
         self.frm.pack(fill='both', expand=True)
 
-        menubar = tk.Menu(root)
+        menubar = tk.Menu(master)
         filemenu = tk.Menu(menubar, tearoff=0)
         filemenu.add_command(label="Open", command=self.open_pdf)
+        filemenu.add_command(label="Save", command=self.save_edits, accelerator="Ctrl+S")
+        filemenu.add_command(label="Save As", command=self.save_edits_as)
         filemenu.add_separator()
-        filemenu.add_command(label="Quit", command=root.quit)
+        filemenu.add_command(label="Quit", command=self.quit)
         menubar.add_cascade(label="File", menu=filemenu)
 
         editmenu = tk.Menu(menubar, tearoff=0)
         editmenu.add_command(label="Show Text", command=self.show_text_window)
+        editmenu.add_command(label="Show All Text", command=lambda: self.show_text_window(whole_document=True))
         editmenu.add_command(label="Merge", command=self.merge)
+        editmenu.add_command(label="Merge (Low Memory)", command=lambda: self.merge(streaming=True))
         editmenu.add_command(label="Split", command=self.split_dialog)
         editmenu.add_command(label="Edit Text")
         menubar.add_cascade(label="Edit", menu=editmenu)
+
+        viewmenu = tk.Menu(menubar, tearoff=0)
+        self.continuous = tk.BooleanVar(value=False)  # Show all pages in one scrolling column
+        viewmenu.add_checkbutton(label="Continuous Scroll", variable=self.continuous, command=self.toggle_continuous)
+        viewmenu.add_separator()
+        self.show_stats = tk.BooleanVar(value=False)  # Overlay with render time, cache hit rate and queue depth
+        viewmenu.add_checkbutton(label="Performance Stats", variable=self.show_stats, command=self.toggle_stats)
+        viewmenu.add_command(label="Export Trace", command=self.export_trace)
+        menubar.add_cascade(label="View", menu=viewmenu)
         editmenu.add_command(label="Add Image", command=self.add_image)
+        editmenu.add_command(label="Stamp Pages", command=self.stamp_pages)
         editmenu.add_command(label="Search Text", command=self.search_text)
+        editmenu.add_command(label="Next Match", command=self.show_next_search_hit, accelerator="F3")
+        editmenu.add_command(label="Previous Match", command=self.show_previous_search_hit, accelerator="Shift+F3")
+        editmenu.add_command(label="Save Highlights", command=self.save_highlights)
         editmenu.add_command(label="Encrypt PDF", command=self.encrypt_pdf)
         editmenu.add_command(label="Decrypt PDF", command=self.decrypt_pdf)
         editmenu.add_command(label="Add Bookmark", command=self.add_bookmark)
-        editmenu.add_command(label="Remove Bookmark", command=self.remove_bookmark)
-        editmenu.add_command(label="Go to Bookmark", command=self.navigate_to_bookmark)
+        editmenu.add_command(label="Bookmarks", command=self.show_bookmarks, accelerator="Ctrl+B")
         editmenu.add_command(label="Add Annotation", command=self.add_text_annotation)
 
-        root.config(menu=menubar)
+        master.config(menu=menubar)
+        master.protocol("WM_DELETE_WINDOW", self.quit)  # The window's close button asks about unsaved edits too
+        master.bind("<Control-s>", lambda event: self.save_edits())
+        master.bind("<Control-b>", lambda event: self.show_bookmarks())
+        master.bind("<F3>", lambda event: self.show_next_search_hit())
+        master.bind("<Shift-F3>", lambda event: self.show_previous_search_hit())
 
         btn_zoom_in = Button(self.frm, text="Zoom In", command=self.zoom_in)
         btn_zoom_in.place(relx=0.24, rely=0.11)
@@ -73,12 +136,14 @@ class PDFViewer:
 
         self.canvas = tk.Canvas(self.frm, bg="white")
         self.canvas.place(relx=0.5, rely=0.5, anchor=tk.CENTER)
-        self.canvas.config(width=550, height=610)
+        self.canvas.config(width=550, height=610, yscrollincrement=40)
+        self.continuous_view = ContinuousView(self.canvas, self.render_scheduler)
+        self.page_photo = PhotoImage()  # Reused for every page shown in single page mode
 
-        self.v_scroll = tk.Scrollbar(self.frm, orient=tk.VERTICAL, command=self.canvas.yview)
+        self.v_scroll = tk.Scrollbar(self.frm, orient=tk.VERTICAL, command=self.scroll_y)
         self.v_scroll.pack(side=tk.RIGHT, fill=tk.Y)
 
-        self.h_scroll = tk.Scrollbar(self.frm, orient=tk.HORIZONTAL, command=self.canvas.xview)
+        self.h_scroll = tk.Scrollbar(self.frm, orient=tk.HORIZONTAL, command=self.scroll_x)
         self.h_scroll.place(relx=0.5, rely=1, anchor=tk.CENTER, relwidth=1)
 
         # Configure the canvas to work with the scrollbars
@@ -86,12 +151,27 @@ class PDFViewer:
 
         self.frm.bind_all("<MouseWheel>", self.on_mouse_scroll)
 
+        # Strip of page thumbnails on the left, click one to go to its page
+        self.thumbnails = ThumbnailStrip(self.frm, self.go_to_page)
+        self.thumbnails.frame.place(relx=0, rely=0.05, relheight=0.9, width=STRIP_WIDTH)
+
         # Setup a label widget for displaying the current page number
         self.page_label = ttk.Label(self.frm, text="")
         self.page_label.place(relx=0.5, rely=0, anchor=tk.CENTER)
 
+        # Label showing which search match is displayed
+        self.search_label = ttk.Label(self.frm, text="")
+        self.search_label.place(relx=0.5, rely=0.03, anchor=tk.CENTER)
+
     def on_mouse_scroll(self, event):
-        if event.delta < 0:
+        if str(event.widget.winfo_toplevel()) != str(self.master):
+            return  # Other windows (bookmarks, text) scroll their own widgets
+        if self.thumbnails.owns(event.widget):
+            self.thumbnails.on_mouse_scroll(event)  # Scroll the thumbnails rather than turning pages
+        elif self.continuous.get():
+            self.canvas.yview_scroll(-1 if event.delta > 0 else 1, "units")  # Scroll through the pages smoothly
+            self.schedule_view_refresh()
+        elif event.delta < 0:
             self.show_next_page()
         elif event.delta > 0:
             self.show_previous_page()
@@ -113,12 +193,9 @@ class PDFViewer:
         if x is None or y is None:
             return  # Return if invalid coordinates are provided
 
-        # Open the PDF with PyMuPDF and add the text annotation
-        page = self.document.load_page(page_num - 1)
-        page.add_freetext_annot(fitz.Rect(x, y, x + 200, y + 50), annotation_text, fontsize=12, rotate=0)
-        self.document.save("annotated.pdf")
-        self.load_pdf("annotated.pdf")  # Reload the modified PDF
-        self.show_page()  # Display the current page
+        # Add the text annotation to the open document, it is written out on the next save
+        self.edit_session.add_text_annotation(page_num - 1, fitz.Rect(x, y, x + 200, y + 50), annotation_text)
+        self.edits_changed({page_num - 1})
 
         messagebox.showinfo("Success", f"Annotation added to page {page_num} at ({x}, {y}).")
 
@@ -130,41 +207,26 @@ class PDFViewer:
         if not bookmark_name:
             return  # Return if no name is provided
 
-        if bookmark_name in self.bookmarks:
-            messagebox.showwarning("Warning", "Bookmark name already exists.")
-            return
-
-        self.bookmarks[bookmark_name] = self.page_number
+        self.bookmarks.add(bookmark_name, self.page_number)
+        self.bookmarks_changed()
         messagebox.showinfo("Success", f"Bookmark '{bookmark_name}' added for page {self.page_number + 1}.")
 
-    def remove_bookmark(self):
-        if not self.document:
-            return  # Return if no document is loaded
-
-        bookmark_name = simpledialog.askstring("Input", "Enter the name of the bookmark to remove:")
-        if not bookmark_name:
-            return  # Return if no name is provided
-
-        if bookmark_name in self.bookmarks:
-            del self.bookmarks[bookmark_name]
-            messagebox.showinfo("Success", f"Bookmark '{bookmark_name}' removed.")
-        else:
-            messagebox.showwarning("Warning", "Bookmark not found.")
-
-    def navigate_to_bookmark(self):
+    def show_bookmarks(self):
         if not self.document:
             return  # Return if no document is loaded
 
-        bookmark_name = simpledialog.askstring("Input", "Enter the name of the bookmark to navigate to:")
-        if not bookmark_name:
-            return  # Return if no name is provided
+        if self.bookmark_panel and self.bookmark_panel.exists():
+            self.bookmark_panel.window.lift()
+            return
+        self.bookmark_panel = BookmarkPanel(self.master, self.bookmarks, self.go_to_page, self.add_bookmark,
+                                            self.bookmarks_changed)
 
-        if bookmark_name in self.bookmarks:
-            self.page_number = self.bookmarks[bookmark_name]
-            self.show_page()
-            messagebox.showinfo("Success", f"Navigated to bookmark '{bookmark_name}'.")
-        else:
-            messagebox.showwarning("Warning", "Bookmark not found.")
+    def bookmarks_changed(self):
+        # The outline is written to the file with the next save, like the other edits
+        self.edit_session.set_outline(self.bookmarks.entries)
+        if self.bookmark_panel and self.bookmark_panel.exists():
+            self.bookmark_panel.reload()
+        self.edits_changed(set())
 
     def encrypt_pdf(self):
         if not self.pdf_path:
@@ -175,20 +237,10 @@ class PDFViewer:
             return  # Return if no password is provided
 
         try:
-            reader = PdfReader(self.pdf_path)
-            writer = PdfWriter()
-
-            for page in reader.pages:
-                writer.add_page(page)
-
-            writer.encrypt(password)
-
             output_pdf_path = filedialog.asksaveasfilename(defaultextension=".pdf", filetypes=[("PDF Files", "*.pdf")],
                                                            title="Save Encrypted PDF")
             if output_pdf_path:
-                with open(output_pdf_path, 'wb') as output_pdf:
-                    writer.write(output_pdf)
-
+                pdf_engine.encrypt_pdf(self.pdf_path, output_pdf_path, password)
                 messagebox.showinfo("Success", "PDF encrypted and saved successfully.")
             else:
                 messagebox.showwarning("Warning", "Save operation cancelled.")
@@ -204,23 +256,14 @@ class PDFViewer:
             return  # Return if no password is provided
 
         try:
-            reader = PdfReader(self.pdf_path)
-            if reader.is_encrypted:
-                if not reader.decrypt(password):
-                    messagebox.showerror("Error", "Incorrect password. Please try again.")
-                    return
-
-            writer = PdfWriter()
-
-            for page in reader.pages:
-                writer.add_page(page)
+            if not pdf_engine.check_password(self.pdf_path, password):
+                messagebox.showerror("Error", "Incorrect password. Please try again.")
+                return
 
             output_pdf_path = filedialog.asksaveasfilename(defaultextension=".pdf", filetypes=[("PDF Files", "*.pdf")],
                                                            title="Save Decrypted PDF")
             if output_pdf_path:
-                with open(output_pdf_path, 'wb') as output_pdf:
-                    writer.write(output_pdf)
-
+                pdf_engine.decrypt_pdf(self.pdf_path, output_pdf_path, password)
                 messagebox.showinfo("Success", "PDF decrypted and saved successfully.")
             else:
                 messagebox.showwarning("Warning", "Save operation cancelled.")
@@ -235,31 +278,171 @@ class PDFViewer:
         if not search_query:
             return  # Return if no search query is provided
 
-        found = False
-        for page_num in range(len(self.document)):
-            page = self.document.load_page(page_num)
-            text_instances = page.search_for(search_query)
-            if text_instances:
-                found = True
-                self.highlight_text(page_num, text_instances)
-                if not self.page_number == page_num:
-                    self.page_number = page_num
-                    self.show_page()
-                break
-
-        if not found:
+        if self.search_index:
+            hits = self.search_index.search(search_query)
+        else:
+            # The index is still being built, fall back to scanning every page
+            hits = []
+            with tracer.span("search_scan", "search"):
+                for page_num in range(len(self.document)):
+                    text_instances = self.document.load_page(page_num).search_for(search_query)
+                    hits.extend((page_num, [inst]) for inst in text_instances)
+
+        if not hits:
             messagebox.showinfo("Search Result", f"'{search_query}' not found in the document.")
+            return
+
+        self.search_hits = hits
+        self.search_hit_number = 0
+        self.search_hits_by_page = {}
+        for hit_number, (page_num, text_instances) in enumerate(hits):
+            self.search_hits_by_page.setdefault(page_num, []).append((hit_number, text_instances))
+        self.show_search_hit()
 
-    def highlight_text(self, page_num, text_instances):
-        page = self.document.load_page(page_num)
-        for inst in text_instances:
-            highlight = page.add_highlight_annot(inst)
-            highlight.update()
-        self.document.save("highlighted.pdf")
-        self.load_pdf("highlighted.pdf")
+    def show_search_hit(self):
+        page_num, text_instances = self.search_hits[self.search_hit_number]
+        self.search_label.config(text=f"Match {self.search_hit_number + 1} of {len(self.search_hits)}")
+
+        if not self.page_number == page_num:
+            self.page_number = page_num
+            self.show_page()  # Draws the highlights once the page is on the canvas
+        else:
+            self.highlight_text()
+
+    def show_next_search_hit(self):
+        if self.search_hits:
+            self.search_hit_number = (self.search_hit_number + 1) % len(self.search_hits)  # Wrap around
+            self.show_search_hit()
+
+    def show_previous_search_hit(self):
+        if self.search_hits:
+            self.search_hit_number = (self.search_hit_number - 1) % len(self.search_hits)
+            self.show_search_hit()
+
+    def set_search_index(self, pdf_path, index):
+        if pdf_path == self.pdf_path:  # Ignore indexes finished after another file was opened
+            self.search_index = index
+
+    def highlight_text(self):
+        # Draw the search matches of the current page as rectangles over the page image.
+        # Nothing is written to the document, see save_highlights for that.
+        self.canvas.delete("highlight")
+        if not self.document or not self.search_hits_by_page:
+            return
+
+        # (page number, unzoomed page rect, canvas position of the page) of the pages on the canvas
+        if self.continuous.get() and self.continuous_view.offsets:
+            view = self.continuous_view
+            placed = [(p, view.page_rects[p], view.page_origin(p)) for p in view.visible_pages(margin=0)]
+        else:
+            placed = [(self.page_number, self.page_rect, (0, 0))]
+
+        mat = page_matrix(self.zoom_factor, self.rotation)
+        for page_num, page_rect, (x, y) in placed:
+            origin = (page_rect * mat).top_left  # Rendered pixmaps start at the zoomed page's corner
+            for hit_number, text_instances in self.search_hits_by_page.get(page_num, ()):
+                color = "#FF8C00" if hit_number == self.search_hit_number else "#F2D600"  # Current match stands out
+                for inst in text_instances:
+                    rect = inst * mat
+                    self.canvas.create_rectangle(rect.x0 - origin.x + x, rect.y0 - origin.y + y, rect.x1 - origin.x + x,
+                                                 rect.y1 - origin.y + y, outline=color, width=2, tags="highlight")
+
+    def save_highlights(self):
+        if not self.document or not self.search_hits:
+            return  # Return if there is nothing to highlight
+
+        for page_num, page_hits in self.search_hits_by_page.items():
+            self.edit_session.add_highlights(page_num, [inst for _, text_instances in page_hits for inst in text_instances])
+        self.edits_changed(set(self.search_hits_by_page))
+
+        if self.save_edits():
+            messagebox.showinfo("Success", f"{len(self.search_hits)} highlights saved.")
+
+    def edits_changed(self, pages):
+        # Only the edited pages are rendered again, everything else stays cached
+        for page_num in pages:
+            self.render_cache.invalidate(self.pdf_path, page_num)
+        self.render_scheduler.set_live_pages(self.pdf_path, self.document, self.edit_session.dirty_pages)
+        if self.continuous.get():
+            self.continuous_view.reload_pages(pages)
+        elif self.page_number in pages:
+            self.show_page()
+
+        # Write the edits out once the user stops editing for a while
+        if self.autosave_job:
+            self.master.after_cancel(self.autosave_job)
+        self.autosave_job = self.master.after(AUTOSAVE_DELAY, self.autosave)
+
+    def autosave(self):
+        self.autosave_job = None
+        if self.edit_session and self.edit_session.dirty and self.edit_session.can_save_incrementally():
+            self.save_edits()  # Files that need a full rewrite wait for an explicit Save As
+
+    def save_edits(self):
+        # Returns False if there are edits left unsaved
+        if not self.edit_session or not self.edit_session.dirty:
+            return True
+        if not self.edit_session.can_save_incrementally():
+            return self.save_edits_as()
+
+        try:
+            self.edit_session.save()  # Appends only the changed objects to the file
+        except Exception as e:
+            messagebox.showerror("Error", f"An error occurred while saving the PDF: {e}")
+            return False
+
+        self.render_scheduler.set_live_pages(self.pdf_path, None, ())  # The file on disk is up to date again
+        self.thumbnails.set_document(self.pdf_path, len(self.document))  # Shows the thumbnails of the edited pages
+        self.thumbnails.set_current(self.page_number)
+        return True
+
+    def save_edits_as(self):
+        if not self.edit_session:
+            return True
+
+        output_pdf_path = filedialog.asksaveasfilename(defaultextension=".pdf", filetypes=[("PDF Files", "*.pdf")],
+                                                       title="Save Modified PDF")
+        if not output_pdf_path:
+            return False
+        if os.path.abspath(output_pdf_path) == os.path.abspath(self.pdf_path):
+            if self.edit_session.can_save_incrementally():
+                return self.save_edits()
+            messagebox.showwarning("Warning", "This PDF has to be saved under a new name.")
+            return False
+
+        try:
+            self.edit_session.save(output_pdf_path)
+        except Exception as e:
+            messagebox.showerror("Error", f"An error occurred while saving the PDF: {e}")
+            return False
+
+        # Continue on the new file so later saves can be incremental again
+        page_number = self.page_number
+        self.load_pdf(output_pdf_path)
+        self.page_number = page_number
         self.show_page()
+        return True
+
+    def close_edits(self):
+        # Returns False if the document has to stay open because its edits were neither saved nor given up.
+        # Edits the autosave has not written yet are only saved when the user says so.
+        if not self.edit_session or not self.edit_session.dirty:
+            return True
+        answer = messagebox.askyesnocancel("Unsaved Changes", "Save the changes to this PDF before closing it?")
+        if answer is None:
+            return False  # Cancel
+        return self.save_edits() if answer else True  # No discards the edits
+
+    def quit(self):
+        if self.close_edits():
+            if os.environ.get(TRACE_ENV):
+                tracer.export(os.environ[TRACE_ENV])  # Tracing was switched on for the whole session
+            self.master.quit()
 
     def open_pdf(self):
+        if not self.close_edits():
+            return  # Keep the current document open rather than losing its edits
+
         file_path = filedialog.askopenfilename(
             filetypes=[("PDF Files", "*.pdf")],  # Filter to show only PDF files
             title="Open PDF File"  # Title of the file dialog
@@ -270,43 +453,274 @@ class PDFViewer:
 
     def load_pdf(self, pdf_path):
         self.pdf_path = pdf_path  # Store the path of the loaded PDF
-        self.document = fitz.open(pdf_path)  # Open the PDF file using PyMuPDF
+        with tracer.span("open", "startup"):
+            self.document = fitz.open(pdf_path)  # Open the PDF file using PyMuPDF
         self.page_number = 0  # Reset to the first page
+        self.first_page_pending = True
+        self.render_cache.invalidate(pdf_path)  # The file on disk may have been rewritten
+
+        self.edit_session = EditSession(self.document, pdf_path)
+        self.bookmarks = Outline(self.document)
+        if self.bookmark_panel and self.bookmark_panel.exists():
+            self.bookmark_panel.set_outline(self.bookmarks)
+        self.text_store = TextStore(self.document)
+        self.thumbnails.set_document(None, 0)  # Filled in by start_background_loading
+        self.continuous_view.clear()  # Laid out again for the new document by show_page
+        self.render_scheduler.set_live_pages(pdf_path, None, ())
+
+        self.search_index = None
+        self.search_hits = []
+        self.search_hits_by_page = {}
+        self.search_label.config(text="")
+
+        # Thumbnails and the search index hash and read the whole file, which would hold up the first page
+        self.master.after(BACKGROUND_LOAD_DELAY, self.start_background_loading, pdf_path)
+
+    def start_background_loading(self, pdf_path):
+        if pdf_path != self.pdf_path:
+            return  # Another file was opened in the meantime
+
+        self.thumbnails.set_document(pdf_path, len(self.document))
+        self.thumbnails.set_current(self.page_number)
+
+        # Build the search index (or load it from disk) without blocking the viewer
+        build_index_in_background(pdf_path, lambda index: self.set_search_index(pdf_path, index))
 
     def show_page(self):
         if not self.document:
             return  # Return if no document is loaded
 
-        # Render the current page as a pixmap (an image) with zoom
+        # Only the single page view of the file just opened renders on this thread, whichever view it opens in
+        first_page = self.first_page_pending
+        self.first_page_pending = False
+
         page = self.document.load_page(self.page_number)
+        self.page_rect = page.rect
         self.width = page.rect.width * 0.97
         self.height = page.rect.height * 0.97
 
-        mat = fitz.Matrix(self.zoom_factor * 0.97, self.zoom_factor * 0.97)  # Create transformation matrix for zoom
-        pix = page.get_pixmap(matrix=mat)
-        img = PhotoImage(data=pix.tobytes("ppm"))  # Convert the pixmap to a Tkinter PhotoImage
+        # Update the page label with the current page right away, the image follows when it is rendered
+        self.page_label.config(text=f"Page {self.page_number + 1} of {len(self.document)}")
+        self.thumbnails.set_current(self.page_number)
+
+        if self.continuous.get():
+            self.show_continuous()
+            return
 
+        if self.zoom_factor >= TILED_ZOOM:
+            self.show_tiled_page(page.rect)  # Too large for a single pixmap, only draw what is visible
+            return
+        self.tiled_page = None
+
+        self.render_started = time.perf_counter()
+        if first_page:
+            # The page tree of a newly opened file is only loaded in this document so far, rendering
+            # here is quicker than waiting for a worker to open and parse the file all over again
+            self.render_scheduler.submit_now(self.document, self.pdf_path, self.page_number, self.zoom_factor,
+                                             self.rotation, self.display_pixmap)
+            return
+
+        # Render the current page as a pixmap (an image) with zoom in a worker process.
+        # This replaces any render still pending, so only the latest page/zoom is drawn.
+        self.render_scheduler.submit(self.pdf_path, self.page_number, self.zoom_factor, self.rotation,
+                                     self.display_pixmap)
+
+    def display_pixmap(self, pix):
+        update_photo(self.page_photo, pix)  # Copy the pixmap samples into the page's PhotoImage
+
+        with tracer.span("canvas", page=self.page_number):
+            self.canvas.place(relx=0.5, rely=0.5, anchor=tk.CENTER)
+            self.canvas.config(width=self.width, height=self.height)
+
+            # One image item shows the page photo; it is only created again after the other views cleared the canvas
+            self.canvas.delete("tile", "preview", "continuous_page")
+            if not self.canvas.find_withtag("page_image"):
+                self.canvas.create_image((0, 0), image=self.page_photo, anchor='nw', tags="page_image")
+            self.highlight_text()
+
+            self.h_scroll.config(command=self.scroll_x)
+            self.v_scroll.config(command=self.scroll_y)
+            self.canvas.config(xscrollcommand=self.h_scroll.set, yscrollcommand=self.v_scroll.set)
+
+            # Update the scroll region to encompass the new image
+            self.canvas.config(scrollregion=(0, 0, pix.width, pix.height))
+
+        # Whole time from show_page to the page on the canvas, including the wait for a render worker
+        if self.render_started is not None:
+            tracer.add("show_page", "view", self.render_started, time.perf_counter(), {"page": self.page_number})
+            self.render_started = None
+
+        # Warm the cache with the neighbouring pages so Previous/Next are instant
+        self.render_scheduler.prefetch(self.pdf_path, self.page_number, len(self.document), self.zoom_factor, self.rotation)
+
+    def release_page_photo(self):
+        # Shrink the single page photo while another view draws the page(s), it can be very large
+        self.page_photo.configure(width=1, height=1)
+        self.page_photo.configure(width=0, height=0)  # Back to taking the size of the next pixmap
+
+    def show_continuous(self):
+        self.tiled_page = None
+        self.release_page_photo()
+        if not self.continuous_view.is_laid_out(self.pdf_path, self.zoom_factor, self.rotation):
+            self.canvas.delete("all")
+            self.canvas.place(relx=0.5, rely=0.5, anchor=tk.CENTER)
+            self.canvas.config(width=self.width, height=self.height)
+            self.continuous_view.layout(self.document, self.pdf_path, self.zoom_factor, self.rotation)
+        self.continuous_view.scroll_to_page(self.page_number)
+        self.highlight_text()
+
+    def toggle_continuous(self):
+        self.canvas.delete("all")
+        self.continuous_view.clear()
+        self.tiled_page = None
+        self.show_page()
+
+    def show_tiled_page(self, page_rect):
+        self.release_page_photo()
+        self.tiled_page = page_rect
+        self.tile_images = {}
+        self.preview_image = None
+
+        # The scroll region covers the whole zoomed page even though only visible tiles get rendered
+        rect = device_rect(page_rect, self.zoom_factor, self.rotation)
         self.canvas.place(relx=0.5, rely=0.5, anchor=tk.CENTER)
-        self.canvas.config(width=self.width, height=self.height)
+        self.canvas.config(width=self.width, height=self.height, scrollregion=(0, 0, rect.width, rect.height))
         self.canvas.delete("all")
 
-        # Create a label to display the image and add it to the canvas
-        self.image_label = Label(self.canvas, image=img)
-        self.image_label.image = img  # Keep a reference to avoid garbage collection
-        self.image_label.pack()
+        # First a quick low resolution render of the page, then the sharp tiles on top of it
+        low_zoom, scale = preview_zoom(self.zoom_factor)
+        self.render_scheduler.submit(self.pdf_path, self.page_number, low_zoom, self.rotation,
+                                     lambda pix: self.display_preview(pix, scale))
+        self.request_visible_tiles(supersede=False)
+        self.highlight_text()
+
+    def visible_region(self):
+        x0 = self.canvas.canvasx(0)
+        y0 = self.canvas.canvasy(0)
+        return x0, y0, x0 + self.canvas.winfo_width(), y0 + self.canvas.winfo_height()
+
+    def request_visible_tiles(self, supersede=True):
+        if not self.tiled_page:
+            return  # Not in tiled mode
+
+        tiles = visible_tiles(self.tiled_page, self.zoom_factor, self.rotation, *self.visible_region())
+
+        # Free the tiles that scrolled out of view, the render cache still has their pixmaps
+        for col, row in set(self.tile_images) - set(tiles):
+            self.canvas.delete(f"tile_{col}_{row}")
+            del self.tile_images[(col, row)]
+
+        missing = [tile for tile in tiles if tile not in self.tile_images]
+        self.render_scheduler.submit_tiles(self.pdf_path, self.page_number, self.zoom_factor, self.rotation,
+                                           missing, self.display_tile, supersede=supersede)
+
+    def display_preview(self, pix, scale):
+        data = pixmap_to_ppm(pix)
+        with tracer.span("photo_image", preview=True):
+            low = PhotoImage(data=data, format="PPM")
+
+        # Only enlarge the part of the preview that is on screen, not the whole page
+        x0, y0, x1, y1 = self.visible_region()
+        x0, y0 = int(x0 // scale), int(y0 // scale)
+        x1, y1 = min(low.width(), int(-(-x1 // scale))), min(low.height(), int(-(-y1 // scale)))
+        if x1 <= x0 or y1 <= y0:
+            return
+
+        self.preview_image = PhotoImage()
+        self.preview_image.tk.call(self.preview_image, "copy", low, "-from", x0, y0, x1, y1, "-zoom", scale, scale)
+        self.canvas.create_image(x0 * scale, y0 * scale, image=self.preview_image, anchor='nw', tags="preview")
+        self.canvas.tag_lower("preview")  # Keep it below any tile that arrived first
+
+    def display_tile(self, tile, pix):
+        if tile in self.tile_images:
+            return  # Already on the canvas
+
+        data = pixmap_to_ppm(pix)
+        with tracer.span("photo_image", tile=f"{tile[0]},{tile[1]}"):
+            img = PhotoImage(data=data, format="PPM")
+        x, y = tile_position(pix, self.tiled_page, self.zoom_factor, self.rotation)
+        self.canvas.create_image(x, y, image=img, anchor='nw', tags=("tile", f"tile_{tile[0]}_{tile[1]}"))
+        self.canvas.tag_raise("highlight")  # Keep the search highlights above the tiles
+        self.tile_images[tile] = img  # Keep a reference to avoid garbage collection
+
+    def scroll_x(self, *args):
+        self.canvas.xview(*args)
+        self.schedule_view_refresh()
+
+    def scroll_y(self, *args):
+        self.canvas.yview(*args)
+        self.schedule_view_refresh()
+
+    def schedule_view_refresh(self):
+        # Wait for the scrollbar to settle so a drag does not queue renders for every position it passes
+        if self.view_refresh_job:
+            self.master.after_cancel(self.view_refresh_job)
+        self.view_refresh_job = self.master.after(30, self.refresh_view)
+
+    def refresh_view(self):
+        self.view_refresh_job = None
+        if not (self.continuous.get() and self.document):
+            self.request_visible_tiles()
+            return
 
-        # Add the image label to the canvas
-        self.canvas.create_window((0, 0), window=self.image_label, anchor='nw')
+        # Render the pages scrolled into view and follow the page in the middle of the viewport
+        self.continuous_view.refresh()
+        page_number = self.continuous_view.current_page()
+        if page_number != self.page_number:
+            self.page_number = page_number
+            self.page_label.config(text=f"Page {self.page_number + 1} of {len(self.document)}")
+            self.thumbnails.set_current(self.page_number)
+        self.highlight_text()
+
+    def toggle_stats(self):
+        if self.show_stats.get():
+            tracer.enabled = True  # The overlay reads the stage timings the tracer records
+            self.update_stats_overlay()
+            return
 
-        self.h_scroll.config(command=self.canvas.xview)
-        self.v_scroll.config(command=self.canvas.yview)
-        self.canvas.config(xscrollcommand=self.h_scroll.set, yscrollcommand=self.v_scroll.set)
+        tracer.enabled = bool(os.environ.get(TRACE_ENV))  # Keep tracing a session started with tracing on
+        if self.stats_job:
+            self.master.after_cancel(self.stats_job)
+            self.stats_job = None
+        self.canvas.delete("stats_overlay")
+
+    def update_stats_overlay(self):
+        lookups = self.render_cache.hits + self.render_cache.misses
+        show_ms = tracer.last_ms("show_page")
+        pixmap_ms = tracer.last_ms("get_pixmap")
+        lines = [
+            f"Last render: {'-' if show_ms is None else f'{show_ms:.1f} ms'}"
+            f" (get_pixmap {'-' if pixmap_ms is None else f'{pixmap_ms:.1f} ms'})",
+            f"Cache hits: {f'{self.render_cache.hits / lookups:.0%} of {lookups}' if lookups else '-'}",
+            f"Render queue: {self.render_scheduler.pending}",
+        ]
+
+        # Drawn again every time, in the top left corner of whatever part of the canvas is visible
+        self.canvas.delete("stats_overlay")
+        x0, y0, _, _ = self.visible_region()
+        text = self.canvas.create_text(x0 + 8, y0 + 8, text="\n".join(lines), anchor='nw', font="TkFixedFont",
+                                       tags="stats_overlay")
+        bx0, by0, bx1, by1 = self.canvas.bbox(text)
+        self.canvas.create_rectangle(bx0 - 4, by0 - 4, bx1 + 4, by1 + 4, fill="#ffffe0", outline="gray",
+                                     tags="stats_overlay")
+        self.canvas.tag_raise(text)
+        self.stats_job = self.master.after(500, self.update_stats_overlay)
+
+    def export_trace(self):
+        if not tracer.events:
+            messagebox.showinfo("Export Trace", "Nothing has been traced yet, turn on View > Performance Stats first.")
+            return
 
-        # Update the scroll region to encompass the new image
-        self.canvas.config(scrollregion=self.canvas.bbox(tk.ALL))
+        output_path = filedialog.asksaveasfilename(defaultextension=".json", filetypes=[("Trace Files", "*.json")], title="Save Trace")
+        if not output_path:
+            return  # Return if the save dialog is cancelled
 
-        # Update the page label with the current page
-        self.page_label.config(text=f"Page {self.page_number + 1} of {len(self.document)}")
+        count = tracer.export(output_path)
+        messagebox.showinfo("Success", f"Saved {count} trace events, open the file in chrome://tracing or ui.perfetto.dev.")
+
+    def go_to_page(self, page_number):
+        self.page_number = page_number
+        self.show_page()
 
     def show_previous_page(self):
         if self.page_number > 0:
@@ -318,16 +732,15 @@ class PDFViewer:
             self.page_number += 1
             self.show_page()  # Update the display to the next page
 
-    def show_text_window(self):
+    def show_text_window(self, whole_document=False):
         if not self.pdf_path:
             return  # Return if no PDF is loaded
 
-        reader = PdfReader(self.pdf_path)  # Create PdfReader object using PyPDF2
-        page = reader.pages[self.page_number]  # Extract the current page of the PDF
-        text = page.extract_text()  # Extract text from the current page
-
         text_window = tk.Toplevel(self.master)  # Create a new window for displaying text
-        text_window.title(f"Text Content of Page {self.page_number + 1}")  # Set window title
+        if whole_document:
+            text_window.title("Text Content of the Document")
+        else:
+            text_window.title(f"Text Content of Page {self.page_number + 1}")  # Set window title
         text_area = tk.Text(text_window, wrap="word")  # Create a text widget
         text_area.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)  # Pack the text widget
 
@@ -335,9 +748,29 @@ class PDFViewer:
         scrollbar.pack(side=tk.RIGHT, fill=tk.Y)  # Add a vertical scrollbar
         text_area['yscrollcommand'] = scrollbar.set  # Link scrollbar to the text widget
 
-        text_area.insert(tk.END, text if text else "No text found on this page.")  # Insert text
         self.center_window(text_window)  # Center the text window
 
+        if whole_document:
+            # Add the text as much as takes about 30 ms at a time so the viewer stays responsive on long documents
+            self.stream_text(text_window, text_area, self.text_store.iter_chunks())
+            return
+
+        text = self.text_store.get(self.page_number, sort=True).strip()  # Text of the current page in reading order
+        text_area.insert(tk.END, text if text else "No text found on this page.")  # Insert text
+
+    def stream_text(self, text_window, text_area, chunks):
+        if not text_window.winfo_exists():
+            return  # Stop if the window was closed
+
+        page_num, text = next(chunks, (None, None))
+        if text is None:
+            text_window.title("Text Content of the Document")
+            return
+
+        text_area.insert(tk.END, text)
+        text_window.title(f"Text Content of the Document (pages 1-{page_num + 1} of {len(self.text_store.document)})")
+        text_window.after(1, self.stream_text, text_window, text_area, chunks)  # Let Tk process events in between
+
     def center_window(self, window):
         window.update_idletasks()  # Update the window's widget tree to ensure dimensions are updated
         screen_width = window.winfo_screenwidth()  # Get the screen width
@@ -347,75 +780,86 @@ class PDFViewer:
         y = screen_height // 2 - size[1] // 2  # Calculate y position to center the window
         window.geometry("+{}+{}".format(x, y))  # Set the geometry of the window to center it
 
-    def merge(self):
-        merger = PdfWriter()  # Create a PdfWriter object
+    def merge(self, streaming=False):
         file_paths = filedialog.askopenfilenames(filetypes=[("PDF Files", "*.pdf")], title="Select PDFs to Merge")
-        for pdf in file_paths:  # List of PDFs to merge
-            merger.append(pdf)  # Append each PDF to the merger
+        if not file_paths:
+            return  # Return if no files are selected
 
         output_path = filedialog.asksaveasfilename(defaultextension=".pdf", filetypes=[("PDF Files", "*.pdf")], title="Save Merged PDF")
-        if output_path:
-            with open(output_path, 'wb') as f:
-                merger.write(f)  # Write the merged PDF to a file
-        merger.close()  # Close the merger
+        if not output_path:
+            return  # Return if the save dialog is cancelled
+
+        if not streaming:
+            pdf_engine.merge_pdfs(file_paths, output_path)  # Write the merged PDF to a file
+            return
+
+        try:
+            stats = pdf_engine.stream_merge_pdfs(list(file_paths), output_path)
+        except Exception as e:
+            messagebox.showerror("Error", f"An error occurred while merging the PDFs: {e}")
+            return
+        messagebox.showinfo("Success", f"Merged {stats['pages']} pages from {stats['files']} files: "
+                                       f"{stats['bytes_written']:,} bytes written, {stats['pages_per_second']} pages/s, "
+                                       f"{stats['duplicates_removed']} duplicate objects shared.")
 
     def rotate_current_page(self):
         if not self.pdf_path:
             return  # Return if no PDF is loaded
-
-        reader = PdfReader(self.pdf_path)  # Create PdfReader object
-        writer = PdfWriter()  # Create PdfWriter object
-
-        for i, page in enumerate(reader.pages):
-            if i == self.page_number:
-                page.rotate(90)  # Rotate the current page by 90 degrees
-            writer.add_page(page)  # Add the page to the writer
+        if not self.close_edits():
+            return  # The rotated copy is made from the file on disk and replaces the document being viewed
 
         output_pdf_path = filedialog.asksaveasfilename(defaultextension=".pdf", filetypes=[("PDF Files", "*.pdf")], title="Save Rotated PDF")
-        if output_pdf_path:
-            with open(output_pdf_path, 'wb') as output_pdf:
-                writer.write(output_pdf)  # Write the rotated PDF to a file
+        if not output_pdf_path:
+            return  # Return if the save dialog is cancelled
 
+        page_number = self.page_number
+        pdf_engine.rotate_page(self.pdf_path, output_pdf_path, page_number, 90)  # Rotate the current page by 90 degrees
         self.load_pdf(output_pdf_path)  # Load the rotated PDF
+        self.page_number = page_number
         self.show_page()  # Display the rotated page
 
     def split_dialog(self):
         if not self.pdf_path:
             return  # Return if no PDF is loaded
 
-        ranges_str = simpledialog.askstring("Input", "Enter page ranges to split (e.g., 1-3,4-5):")
-        if ranges_str:
-            ranges = self.parse_ranges(ranges_str)
-            self.split(ranges)
+        rule = simpledialog.askstring("Input", "Enter page ranges to split (e.g., 1-3,4-5), 'every N' for parts of "
+                                               "N pages or 'outline' for one part per chapter:")
+        if not rule:
+            return  # Return if no rule is provided
+
+        if pdf_engine.parse_split_rule(rule)[0] == "ranges":
+            self.split(self.parse_ranges(rule))  # Ask for the name of every part
+            return
+
+        output_dir = filedialog.askdirectory(title="Select Folder for the Split PDFs")
+        if not output_dir:
+            return  # Return if no folder is selected
+
+        try:
+            stats = pdf_engine.split_document(self.pdf_path, rule, os.path.join(output_dir, "{stem}_{index:03d}.pdf"))
+        except Exception as e:
+            messagebox.showerror("Error", f"An error occurred while splitting the PDF: {e}")
+            return
+        messagebox.showinfo("Success", f"Split into {stats['parts']} files in {stats['seconds']} s.")
 
     def parse_ranges(self, ranges_str):
-        ranges = []
-        for part in ranges_str.split(','):
-            if '-' in part:
-                start, end = map(int, part.split('-'))
-                ranges.append((start, end))
-            else:
-                num = int(part)
-                ranges.append((num, num))
-        return ranges
+        return pdf_engine.parse_ranges(ranges_str)
 
     def split(self, ranges):
         if not self.pdf_path:
             return  # Return if no PDF is loaded
 
-        reader = PdfReader(self.pdf_path)  # Create PdfReader object
-
-        for i, (start, end) in enumerate(ranges):
-            writer = PdfWriter()
-            for j in range(start-1, end):
-                writer.add_page(reader.pages[j])
-
+        output_paths = []
+        for i in range(len(ranges)):
             output_pdf_path = filedialog.asksaveasfilename(defaultextension=".pdf", filetypes=[("PDF Files", "*.pdf")], title=f"Save Split PDF {i + 1}")
-            if output_pdf_path:
-                with open(output_pdf_path, 'wb') as output_pdf:
-                    writer.write(output_pdf)  # Write the split PDF to a file
-            else:
+            if not output_pdf_path:
                 break  # Stop if the user cancels the save dialog
+            output_paths.append(output_pdf_path)
+
+        try:
+            pdf_engine.split_pdf(self.pdf_path, ranges[:len(output_paths)], output_paths)  # Write the split PDFs
+        except Exception as e:
+            messagebox.showerror("Error", f"An error occurred while splitting the PDF: {e}")
 
     def zoom_in(self):
         if not self.document:
@@ -445,21 +889,29 @@ class PDFViewer:
         if x is None or y is None:
             return  # Return if invalid coordinates are provided
 
-        # Open the PDF with PyMuPDF and add the image
-        page = self.document.load_page(page_num - 1)
+        # Add the image to the open document, it is written out on the next save
         rect = fitz.Rect(x, y, x + 200, y + 200)  # Adjust the size of the image as needed
-        page.insert_image(rect, filename=image_path)
-
-        # Save the modified PDF
-        output_pdf_path = filedialog.asksaveasfilename(defaultextension=".pdf", filetypes=[("PDF Files", "*.pdf")],
-                                                       title="Save Modified PDF")
-        if output_pdf_path:
-            self.document.save(output_pdf_path)
-            self.load_pdf(output_pdf_path)  # Reload the modified PDF
-            self.show_page()  # Display the current page
+        self.edit_session.insert_image(page_num - 1, rect, image_path)
+        self.edits_changed({page_num - 1})
 
         print(f"Image added to page {page_num} at ({x}, {y})")
 
+    def stamp_pages(self):
+        if not self.document:
+            return  # Return if no document is loaded
+
+        spec_path = filedialog.askopenfilename(filetypes=[("Stamp Specs", "*.json")], title="Select Stamp Spec")
+        if not spec_path:
+            return  # Return if no spec is selected
+
+        try:
+            pages = self.edit_session.apply_stamps(pdf_engine.load_stamp_spec(spec_path))
+        except Exception as e:
+            messagebox.showerror("Error", f"An error occurred while stamping the PDF: {e}")
+            return
+        self.edits_changed(pages)
+        messagebox.showinfo("Success", f"Stamped {len(pages)} pages.")
+
     def zoom_out(self):
         if not self.document:
             return  # Return if no document is loaded
@@ -470,13 +922,33 @@ class PDFViewer:
     def on_resize(self, event):
         self.canvas.config(scrollregion=self.canvas.bbox(tk.ALL))  # Update the scroll region
 
-# Create the main window for the application
-root = tk.Tk()
-root.title("PDF Viewer")  # Set the window title
-root.geometry("1400x1000")  # Set the initial window size to be larger
-
-# Create an instance of the PDFViewer class with the main window and initial PDF file
-app = PDFViewer(root)
-
-# Start the Tkinter event loop
-root.mainloop()  # Run the main event loop
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="PDF viewer")
+    parser.add_argument("pdf", nargs='?', help="PDF file to open")
+    parser.add_argument("--startup-time", action="store_true", help="Print how long it took to show the first page")
+    args = parser.parse_args()
+    imports_done = time.perf_counter()
+
+    # Create the main window for the application
+    root = tk.Tk()
+    root.title("PDF Viewer")  # Set the window title
+    root.geometry("1400x1000")  # Set the initial window size to be larger
+
+    # Create an instance of the PDFViewer class with the main window and initial PDF file
+    app = PDFViewer(root)
+    window_done = time.perf_counter()
+
+    if args.pdf:
+        app.load_pdf(args.pdf)
+        app.show_page()  # The first page is rendered before anything else of the file is looked at
+
+    if args.startup_time:
+        root.update()  # Draw the window (and the first page) before taking the time
+        shown = time.perf_counter()
+        tracer.add("startup", "startup", STARTUP_START, shown)
+        print(f"Startup took {(shown - STARTUP_START) * 1000:.0f} ms: imports {(imports_done - STARTUP_START) * 1000:.0f} ms, "
+              f"window {(window_done - imports_done) * 1000:.0f} ms, "
+              f"{'first page' if args.pdf else 'first draw'} {(shown - window_done) * 1000:.0f} ms")
+
+    # Start the Tkinter event loop
+    root.mainloop()  # Run the main event loop
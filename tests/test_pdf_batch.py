@@ -0,0 +1,25 @@
+import os
+
+import pytest
+
+import pdf_batch
+
+
+def test_output_paths_keep_the_layout_of_a_directory(tmp_path):
+    for folder in ("a", "b"):
+        (tmp_path / folder).mkdir()
+        (tmp_path / folder / "x.pdf").write_bytes(b"%PDF-1.7\n")
+
+    found = pdf_batch.find_pdfs([str(tmp_path)])
+    paths = pdf_batch.output_paths(found, "out")
+
+    assert sorted(output for _, output in paths) == [os.path.join("out", "a", "x.pdf"),
+                                                      os.path.join("out", "b", "x.pdf")]
+
+
+def test_output_paths_refuse_two_inputs_with_the_same_output():
+    found = pdf_batch.find_pdfs([os.path.join("a", "x.pdf"), os.path.join("b", "x.pdf")])
+    with pytest.raises(ValueError, match="would both be written"):
+        pdf_batch.output_paths(found, "out")
+    with pytest.raises(ValueError, match="would both be written"):
+        pdf_batch.output_paths(found[:1] * 2)  # The same file twice, in place
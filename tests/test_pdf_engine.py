@@ -0,0 +1,132 @@
+import json
+import os
+
+import fitz  # PyMuPDF: Builds the input documents and reads the results back
+import pytest
+
+import pdf_engine
+
+
+def make_inline_resources_pdf(path, text):
+    # One page whose font and graphics state are written inline in its /Resources, so the page
+    # object itself contains "/Type/Font" and "/Type/ExtGState"
+    document = fitz.open()
+    page = document.new_page()
+    document.xref_set_key(page.xref, "Resources",
+                          "<</Font<</F1<</Type/Font/Subtype/Type1/BaseFont/Helvetica>>>>"
+                          "/ExtGState<</G1<</Type/ExtGState/CA 1>>>>>>")
+    contents = document.get_new_xref()
+    document.update_object(contents, "<<>>")
+    document.update_stream(contents, f"BT /F1 24 Tf 72 720 Td ({text}) Tj ET".encode())
+    document.xref_set_key(page.xref, "Contents", f"{contents} 0 R")
+    document.save(path)
+    document.close()
+
+
+def test_stream_merge_keeps_pages_with_inline_resources(tmp_path):
+    source = str(tmp_path / "cover.pdf")
+    output = str(tmp_path / "merged.pdf")
+    make_inline_resources_pdf(source, "Cover sheet")
+
+    stats = pdf_engine.stream_merge_pdfs([source] * 3, output, batch_size=2)
+
+    with fitz.open(output) as merged:
+        assert len(merged) == 3
+        for page in merged:
+            assert page.get_text().strip() == "Cover sheet"
+    assert stats["duplicates_removed"] == 2  # Only the content streams of the second and third copy
+
+
+def test_stream_merge_dedupes_shared_fonts(tmp_path):
+    source = str(tmp_path / "letter.pdf")
+    output = str(tmp_path / "merged.pdf")
+    document = fitz.open()
+    document.new_page().insert_text((72, 72), "Letter", fontname="helv")
+    document.save(source)
+    document.close()
+
+    stats = pdf_engine.stream_merge_pdfs([source] * 3, output)
+
+    with fitz.open(output) as merged:
+        assert [page.get_text().strip() for page in merged] == ["Letter"] * 3
+    assert stats["duplicates_removed"] > 0
+
+
+def write_spec(tmp_path, stamps):
+    path = tmp_path / "stamps.json"
+    path.write_text(json.dumps(stamps))
+    return str(path)
+
+
+@pytest.mark.parametrize("stamp, problem", [
+    ({"type": "image", "rect": [0, 0, 10, 10]}, "need a file"),
+    ({"type": "image", "file": "missing.png", "rect": [0, 0, 10, 10]}, "does not exist"),
+    ({"type": "text", "text": "x", "rect": [0, "a", 10, 10]}, "rect"),
+    ({"type": "text", "text": "x", "rect": [0, 0, 10, 10], "pages": "2-x"}, "pages"),
+    ({"type": "text", "text": "x", "rect": [0, 0, 10, 10], "pages": [1, "b"]}, "pages"),
+    ({"type": "box", "rect": [0, 0, 10, 10]}, "type"),
+])
+def test_load_stamp_spec_rejects_bad_stamps(tmp_path, stamp, problem):
+    with pytest.raises(ValueError, match=problem):
+        pdf_engine.load_stamp_spec(write_spec(tmp_path, [stamp]))
+
+
+def make_pdf(path, pages=3):
+    document = fitz.open()
+    for number in range(pages):
+        document.new_page().insert_text((72, 72), f"Page {number + 1}")
+    document.save(path)
+    document.close()
+
+
+def test_crypt_skips_files_already_encrypted_the_same_way(tmp_path):
+    path = str(tmp_path / "doc.pdf")
+    make_pdf(path)
+
+    assert pdf_engine.crypt_pdf(path, path, "secret", "encrypt", "aes-256")["skipped"] is False
+    assert pdf_engine.crypt_pdf(path, path, "secret", "encrypt", "aes-256")["skipped"] is True
+
+    stats = pdf_engine.crypt_pdf(path, path, "secret", "encrypt", "aes-128")  # Other method: rewritten
+    assert stats["skipped"] is False
+    with fitz.open(path) as document:
+        assert document.authenticate("secret")
+        assert "128-bit AES" in document.metadata["encryption"]
+
+    assert pdf_engine.crypt_pdf(path, path, "secret", "decrypt")["skipped"] is False
+    assert pdf_engine.crypt_pdf(path, path, "secret", "decrypt")["skipped"] is True
+    assert os.listdir(tmp_path) == ["doc.pdf"]  # No .part file left behind
+
+
+def test_failed_write_keeps_the_output_and_leaves_no_part_file(tmp_path):
+    output = tmp_path / "out.pdf"
+    output.write_bytes(b"old")
+
+    def write(tmp_path):
+        with open(tmp_path, 'wb') as f:
+            f.write(b"half")
+        raise OSError("disk full")
+
+    with pytest.raises(OSError):
+        pdf_engine._replace_output(str(output), write)
+    assert output.read_bytes() == b"old"
+    assert os.listdir(tmp_path) == ["out.pdf"]
+
+
+def test_stamped_image_is_embedded_once_per_file(tmp_path):
+    source = str(tmp_path / "doc.pdf")
+    output = str(tmp_path / "stamped.pdf")
+    make_pdf(source, pages=4)
+    fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 8, 8), False).save(str(tmp_path / "logo.png"))
+    stamps = pdf_engine.load_stamp_spec(write_spec(tmp_path, [
+        {"type": "image", "file": "logo.png", "rect": [-60, 20, -20, 60]},
+        {"type": "text", "text": "DRAFT", "rect": [20, -60, 200, -20], "pages": "1-2"},
+    ]))
+
+    stats = pdf_engine.stamp_pdf(source, output, stamps)
+
+    assert stats["pages"] == 4
+    with fitz.open(output) as document:
+        xrefs = {image[0] for page in document for image in page.get_images()}
+        assert len(xrefs) == 1
+        assert all(page.get_images() for page in document)
+        assert [len(list(page.annots())) for page in document] == [1, 1, 0, 0]
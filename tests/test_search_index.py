@@ -0,0 +1,26 @@
+import fitz  # PyMuPDF: Builds the document that is indexed
+
+from search_index import SearchIndex
+
+
+def build_index(*lines):
+    document = fitz.open()
+    page = document.new_page()
+    for number, line in enumerate(lines):
+        page.insert_text((72, 72 + 20 * number), line)
+    return document, SearchIndex.build(document)
+
+
+def test_words_match_inside_words_like_search_for():
+    document, index = build_index("Agreement-Termination notice, sent by e-mail.")
+    for query in ("agreement", "Agree", "termination", "mail", "e-mail", "notice"):
+        assert len(index.search(query)) == len(document[0].search_for(query)) == 1, query
+    assert index.search("contract") == []
+
+
+def test_phrases_match_across_words():
+    _, index = build_index("The Agreement-Termination notice was sent.", "Termination of notices")
+    assert [len(rects) for _, rects in index.search("termination notice")] == [2]
+    assert len(index.search("termination notice was sent")) == 1
+    assert len(index.search("of notice")) == 1  # The last word only has to start a word
+    assert index.search("notice sent") == []
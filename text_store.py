@@ -0,0 +1,39 @@
+import time
+from collections import OrderedDict
+
+
+# Memoized plain text of the pages of an open fitz.Document.
+# Only the most recently used pages are kept, so reading through a long book does not keep all of it.
+class TextStore:
+    def __init__(self, document, max_pages=256):
+        self.document = document
+        self.max_pages = max_pages
+        self._pages = OrderedDict()  # page number -> text
+
+    def get(self, page_number, sort=False):
+        # sort=True puts the text blocks in reading order (top to bottom, left to right), which makes
+        # extraction an order of magnitude slower on dense pages. Only worth it for a single page.
+        key = (page_number, sort)
+        text = self._pages.get(key)
+        if text is None:
+            text = self.document.load_page(page_number).get_text("text", sort=sort)
+            self._pages[key] = text
+            if len(self._pages) > self.max_pages:
+                self._pages.popitem(last=False)  # Forget the least recently used page
+        else:
+            self._pages.move_to_end(key)
+        return text
+
+    def iter_chunks(self, max_seconds=0.03, start=0):
+        # Yields (last page number, text of the pages extracted within max_seconds) for the pages from
+        # start on. Chunks are bounded by time rather than by pages, dense pages take much longer.
+        chunk = []
+        chunk_start = time.perf_counter()
+        for page_number in range(start, len(self.document)):
+            chunk.append(f"--- Page {page_number + 1} ---\n{self.get(page_number)}\n")
+            if time.perf_counter() - chunk_start >= max_seconds:
+                yield page_number, "".join(chunk)
+                chunk = []
+                chunk_start = time.perf_counter()
+        if chunk:
+            yield len(self.document) - 1, "".join(chunk)
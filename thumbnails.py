@@ -0,0 +1,210 @@
+import os
+import queue
+import threading
+import tkinter as tk
+from collections import OrderedDict
+from concurrent.futures.process import BrokenProcessPool
+from tkinter import PhotoImage
+
+import fitz  # PyMuPDF: Thumbnails are rendered at low resolution in a worker process
+
+from doc_cache import background_pool, cache_path, document_hash, worker_document, worker_task
+
+
+THUMB_WIDTH = 110  # Largest size of a thumbnail image
+THUMB_HEIGHT = 140
+SLOT_HEIGHT = THUMB_HEIGHT + 26  # Image, page number and gap
+STRIP_WIDTH = THUMB_WIDTH + 20
+MAX_IMAGES = 200  # Thumbnail PhotoImages kept in memory, the rest are reloaded from the disk cache
+
+
+def thumbnail_path(doc_hash, page_number):
+    return cache_path("thumbs", doc_hash, f"{page_number}.png")
+
+
+def render_thumbnail(document, page_number, output_path):
+    page = document.load_page(page_number)
+    zoom = min(THUMB_WIDTH / page.rect.width, THUMB_HEIGHT / page.rect.height)
+    pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom))
+    tmp_path = output_path + ".tmp"
+    pix.save(tmp_path, output="png")
+    os.replace(tmp_path, output_path)  # Never leave a half written thumbnail in the cache
+
+
+@worker_task
+def render_thumbnail_file(pdf_path, page_number, output_path):
+    render_thumbnail(worker_document(pdf_path), page_number, output_path)  # Runs in the worker process
+
+
+# Background thread that finds thumbnails in the disk cache or has a worker process render them into it.
+# The thread only waits for the process, so rendering never holds the GIL of the viewer's process.
+class ThumbnailWorker:
+    def __init__(self):
+        self.results = queue.Queue()  # (pdf_path, page number, png path) of finished thumbnails
+        self._pending = []
+        self._pdf_path = None
+        self._pool = None  # Started with the first thumbnail that is not in the disk cache yet
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="pdf-thumbnails", daemon=True)
+        self._thread.start()
+
+    def request(self, pdf_path, pages):
+        with self._condition:
+            # Replace, rather than extend, the queue so pages scrolled past are never rendered
+            self._pdf_path = pdf_path
+            self._pending = list(pages)
+            self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._pending:
+                    self._condition.wait()
+                pdf_path = self._pdf_path
+                page_number = self._pending.pop(0)
+
+            try:
+                # Hashed for every thumbnail (document_hash only reads the file again once it changed):
+                # a save appends to the open file, and its thumbnails belong under the new contents' hash
+                path = thumbnail_path(document_hash(pdf_path), page_number)
+                if not os.path.exists(path):
+                    if self._pool is None:
+                        self._pool = background_pool()
+                    try:
+                        self._pool.submit(render_thumbnail_file, pdf_path, page_number, path).result()
+                    except BrokenProcessPool:
+                        self._pool = None  # The worker died, the next thumbnail starts a new one
+                        raise
+                self.results.put((pdf_path, page_number, path))
+            except Exception as e:
+                print(f"Thumbnail of page {page_number + 1} failed: {e}")
+
+
+# Scrollable strip of page thumbnails. Only the visible slots exist as canvas items; they are
+# moved and given other pages' images while scrolling instead of creating an item per page.
+class ThumbnailStrip:
+    def __init__(self, parent, on_select):
+        self.on_select = on_select  # Called with the page number of a clicked thumbnail
+        self.pdf_path = None
+        self.page_count = 0
+        self.current_page = 0
+
+        self.frame = tk.Frame(parent, width=STRIP_WIDTH)
+        self.canvas = tk.Canvas(self.frame, width=STRIP_WIDTH - 16, bg="#E8E8E8", highlightthickness=0)
+        self.scrollbar = tk.Scrollbar(self.frame, orient=tk.VERTICAL, command=self.scroll)
+        self.canvas.config(yscrollcommand=self.scrollbar.set)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+
+        self.canvas.bind("<Configure>", lambda event: self.refresh())
+        self.canvas.bind("<Button-1>", self.on_click)
+
+        self.slots = []  # (image item, label item) reused for whichever pages are visible
+        self.slot_pages = []  # Page shown by each slot
+        self.images = OrderedDict()  # page number -> PhotoImage, least recently used first
+        self.worker = ThumbnailWorker()
+        self.canvas.after(50, self.poll)
+
+    def owns(self, widget):
+        return widget is self.canvas
+
+    def set_document(self, pdf_path, page_count):
+        self.pdf_path = pdf_path
+        self.page_count = page_count
+        self.current_page = 0
+        self.images.clear()
+        self.slot_pages = [None] * len(self.slots)
+        for image_item, label_item in self.slots:
+            self.canvas.itemconfig(image_item, image="")
+        self.canvas.config(scrollregion=(0, 0, STRIP_WIDTH - 16, page_count * SLOT_HEIGHT))
+        self.canvas.yview_moveto(0)
+        self.refresh()
+
+    def set_current(self, page_number):
+        self.current_page = page_number
+        top = self.canvas.canvasy(0)
+        bottom = top + self.canvas.winfo_height()
+        if not top <= page_number * SLOT_HEIGHT <= bottom - SLOT_HEIGHT:
+            self.canvas.yview_moveto(max(0, page_number * SLOT_HEIGHT - self.canvas.winfo_height() / 3)
+                                     / max(1, self.page_count * SLOT_HEIGHT))
+        self.refresh()
+
+    def scroll(self, *args):
+        self.canvas.yview(*args)
+        self.refresh()
+
+    def on_mouse_scroll(self, event):
+        self.canvas.yview_scroll(-1 if event.delta > 0 else 1, "units")
+        self.refresh()
+
+    def on_click(self, event):
+        page_number = int(self.canvas.canvasy(event.y) // SLOT_HEIGHT)
+        if 0 <= page_number < self.page_count:
+            self.on_select(page_number)
+
+    def visible_pages(self):
+        top = self.canvas.canvasy(0)
+        first = max(0, int(top // SLOT_HEIGHT))
+        last = min(self.page_count - 1, int((top + self.canvas.winfo_height()) // SLOT_HEIGHT))
+        return range(first, last + 1)
+
+    def refresh(self):
+        if not self.pdf_path:
+            return
+
+        pages = self.visible_pages()
+        while len(self.slots) < len(pages):  # Only grows to the number of thumbnails that fit on screen
+            self.slots.append((self.canvas.create_image(0, 0, anchor='n'),
+                               self.canvas.create_text(0, 0, anchor='n', font=("TkDefaultFont", 8))))
+            self.slot_pages.append(None)
+
+        self.canvas.delete("current_page")
+        missing = []
+        for slot, (image_item, label_item) in enumerate(self.slots):
+            if slot >= len(pages):
+                self.canvas.itemconfig(image_item, state=tk.HIDDEN)
+                self.canvas.itemconfig(label_item, state=tk.HIDDEN)
+                self.slot_pages[slot] = None
+                continue
+
+            page_number = pages[slot]
+            x, y = (STRIP_WIDTH - 16) / 2, page_number * SLOT_HEIGHT + 4
+            self.canvas.coords(image_item, x, y)
+            self.canvas.coords(label_item, x, y + THUMB_HEIGHT + 4)
+            self.canvas.itemconfig(label_item, text=str(page_number + 1), state=tk.NORMAL)
+            self.canvas.itemconfig(image_item, image=self.image_for(page_number) or "", state=tk.NORMAL)
+            self.slot_pages[slot] = page_number
+            if page_number not in self.images:
+                missing.append(page_number)
+            if page_number == self.current_page:
+                self.canvas.create_rectangle(4, y - 3, STRIP_WIDTH - 20, y + THUMB_HEIGHT + 18,
+                                             outline="#1E6FD9", width=2, tags="current_page")
+
+        if missing:
+            self.worker.request(self.pdf_path, missing)
+
+    def image_for(self, page_number):
+        image = self.images.get(page_number)
+        if image is not None:
+            self.images.move_to_end(page_number)
+        return image
+
+    def poll(self):
+        # Picks up thumbnails finished by the worker and shows them if their page is still visible
+        while True:
+            try:
+                pdf_path, page_number, path = self.worker.results.get_nowait()
+            except queue.Empty:
+                break
+            if pdf_path != self.pdf_path or page_number not in self.slot_pages:
+                continue
+            try:
+                self.images[page_number] = PhotoImage(file=path)
+            except tk.TclError as e:
+                print(f"Unreadable thumbnail {path}: {e}")
+                continue
+            if len(self.images) > MAX_IMAGES:
+                self.images.popitem(last=False)
+            image_item, _ = self.slots[self.slot_pages.index(page_number)]
+            self.canvas.itemconfig(image_item, image=self.images[page_number])
+        self.canvas.after(50, self.poll)
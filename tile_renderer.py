@@ -0,0 +1,59 @@
+import math
+
+import fitz  # PyMuPDF: get_pixmap(clip=...) rasterizes just one tile of a page
+
+from perf_trace import tracer
+from render_cache import page_matrix, render_key
+
+
+TILE_SIZE = 512  # Edge length of a tile in device pixels
+TILED_ZOOM = 1.5  # From this zoom factor on, pages are drawn as tiles instead of one pixmap
+TILE_MARGIN = 1  # Extra ring of tiles rendered around the visible region so panning finds them ready
+
+
+def device_rect(page_rect, zoom_factor, rotation=0):
+    return page_rect * page_matrix(zoom_factor, rotation)  # Size of the whole page once zoomed
+
+
+def tile_key(pdf_path, page_number, zoom_factor, rotation, col, row):
+    return render_key(pdf_path, page_number, zoom_factor, rotation) + (col, row)
+
+
+def preview_zoom(zoom_factor):
+    # Zoom for the low resolution placeholder, chosen so that it scales back up by a whole number
+    scale = math.ceil(zoom_factor)
+    return zoom_factor / scale, scale
+
+
+def visible_tiles(page_rect, zoom_factor, rotation, x0, y0, x1, y1, margin=TILE_MARGIN):
+    # Tiles of the zoomed page intersecting the canvas region (x0, y0)-(x1, y1), nearest the centre first
+    rect = device_rect(page_rect, zoom_factor, rotation)
+    cols = math.ceil(rect.width / TILE_SIZE)
+    rows = math.ceil(rect.height / TILE_SIZE)
+
+    first_col = max(0, int(x0 // TILE_SIZE) - margin)
+    last_col = min(cols - 1, int(x1 // TILE_SIZE) + margin)
+    first_row = max(0, int(y0 // TILE_SIZE) - margin)
+    last_row = min(rows - 1, int(y1 // TILE_SIZE) + margin)
+
+    centre = ((x0 + x1) / 2 / TILE_SIZE, (y0 + y1) / 2 / TILE_SIZE)
+    tiles = [(col, row) for row in range(first_row, last_row + 1) for col in range(first_col, last_col + 1)]
+    tiles.sort(key=lambda t: (t[0] + 0.5 - centre[0]) ** 2 + (t[1] + 0.5 - centre[1]) ** 2)
+    return tiles
+
+
+def render_tile(document, page_number, zoom_factor, rotation, col, row):
+    with tracer.span("load_page", page=page_number):
+        page = document.load_page(page_number)
+    mat = page_matrix(zoom_factor, rotation)
+    rect = page.rect * mat
+    tile = fitz.Rect(rect.x0 + col * TILE_SIZE, rect.y0 + row * TILE_SIZE,
+                     rect.x0 + (col + 1) * TILE_SIZE, rect.y0 + (row + 1) * TILE_SIZE) & rect
+    with tracer.span("get_pixmap", page=page_number, zoom=zoom_factor, tile=f"{col},{row}"):
+        return page.get_pixmap(matrix=mat, clip=tile * ~mat)  # Clip is given in unzoomed page coordinates
+
+
+def tile_position(pix, page_rect, zoom_factor, rotation=0):
+    # Canvas coordinates of a rendered tile, relative to the top left corner of the zoomed page
+    rect = device_rect(page_rect, zoom_factor, rotation)
+    return pix.x - round(rect.x0), pix.y - round(rect.y0)